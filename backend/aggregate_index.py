@@ -0,0 +1,178 @@
+# aggregate_index.py
+#
+# Per-column summaries (count, mean, squared deviations, min/max, histogram and quantile
+# sketch) of every numeric column of a dataset, stored as a sidecar. The index is built
+# once after upload, in the background, so statistics queries can be answered from it
+# without reading the dataset. It is stamped with the dataset's mtime and size and
+# ignored once the dataset changes.
+
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+import columnar
+from sidecar import ensure_meta_dir, register_suffix, sidecar_path
+from streaming_aggregates import ColumnSummary
+
+AGGREGATE_INDEX_SUFFIX = register_suffix('aggindex.json')
+# Bump when the record format changes, so older indexes are rebuilt
+INDEX_VERSION = 2
+# Rows per chunk; every column of a chunk is in memory at once
+INDEX_CHUNK_ROWS = 1 << 17
+
+# Datasets whose index is being built, so each is only built once at a time
+_building = set()
+# Absolute path -> source stamp of builds that failed and could not be recorded on disk
+_failed = {}
+_building_lock = threading.Lock()
+
+
+def _source_stamp(file_path):
+    stat = os.stat(columnar.backing_path(file_path))
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _write_record(file_path, record):
+    ensure_meta_dir(file_path)
+    path = sidecar_path(file_path, AGGREGATE_INDEX_SUFFIX)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, path)
+
+
+def _record_failure(file_path, stamp, error):
+    # A failed build is recorded for this version of the dataset, so it is not retried
+    # until the dataset changes
+    logging.warning(f"Could not build the aggregate index of {file_path}: {error}")
+    try:
+        _write_record(file_path, {"version": INDEX_VERSION, "source": stamp, "error": str(error)})
+    except OSError:
+        with _building_lock:
+            _failed[os.path.abspath(file_path)] = stamp
+
+
+def build_index(file_path, chunk_rows=INDEX_CHUNK_ROWS):
+    """
+    Summarize every numeric column of file_path in one pass and store the index sidecar.
+
+    Returns:
+    dict: The index record.
+    """
+    stamp = _source_stamp(file_path)
+    summaries = {column_name: ColumnSummary() for column_name in columnar.column_names(file_path)}
+    for chunk in columnar.iter_chunks(file_path, list(summaries), chunk_rows):
+        for column_name in list(summaries):
+            values = chunk[column_name]
+            if not pd.api.types.is_numeric_dtype(values):
+                del summaries[column_name]  # Text columns have no numeric aggregates
+                continue
+            summaries[column_name].update(values.to_numpy())
+
+    index = {
+        "version": INDEX_VERSION,
+        "source": stamp,
+        "columns": {column_name: summary.to_dict() for column_name, summary in summaries.items()},
+    }
+    _write_record(file_path, index)
+    logging.info(f"Built aggregate index of {file_path} ({len(summaries)} columns)")
+    return index
+
+
+def _claim(file_path):
+    key = os.path.abspath(file_path)
+    with _building_lock:
+        if key in _building:
+            return None
+        _building.add(key)
+    return key
+
+
+def _release(key):
+    with _building_lock:
+        _building.discard(key)
+
+
+def _build_or_record_failure(file_path):
+    try:
+        stamp = _source_stamp(file_path)
+    except OSError:
+        return None  # The dataset is gone
+    try:
+        return build_index(file_path)
+    except Exception as e:
+        _record_failure(file_path, stamp, e)
+        return None
+
+
+def build_in_background(file_path):
+    """Build the index of file_path in a daemon thread, unless a build is already running."""
+    key = _claim(file_path)
+    if key is None:
+        return
+
+    def run():
+        try:
+            _build_or_record_failure(file_path)
+        finally:
+            _release(key)
+
+    threading.Thread(target=run, name="aggregate-index", daemon=True).start()
+
+
+def build_now(file_path):
+    """
+    Build the index of file_path in this thread.
+
+    Returns:
+    dict: The index, or None if the build failed or another build is already running.
+    """
+    key = _claim(file_path)
+    if key is None:
+        return None
+    try:
+        return _build_or_record_failure(file_path)
+    finally:
+        _release(key)
+
+
+def _load_record(file_path):
+    # The sidecar record (an index or a recorded failure) if it matches the dataset
+    stamp = _source_stamp(file_path)
+    try:
+        with open(sidecar_path(file_path, AGGREGATE_INDEX_SUFFIX)) as f:
+            record = json.load(f)
+        if record.get("version") == INDEX_VERSION and record.get("source") == stamp:
+            return record
+    except (OSError, ValueError):
+        pass
+    with _building_lock:
+        if _failed.get(os.path.abspath(file_path)) == stamp:
+            return {"source": stamp, "error": "Build failed"}
+    return None
+
+
+def load_index(file_path):
+    """The index of file_path, or None if there is none, it failed, or the dataset has changed since."""
+    record = _load_record(file_path)
+    return record if record is not None and "error" not in record else None
+
+
+def needs_build(file_path):
+    """True unless the current version of file_path has an index or a recorded failed build."""
+    return _load_record(file_path) is None
+
+
+def indexed_summaries(index, column_names):
+    """
+    Column summaries from an index returned by load_index.
+
+    Returns:
+    dict: Column name -> ColumnSummary, or None unless every column is in the index.
+    """
+    if index is None or any(column_name not in index["columns"] for column_name in column_names):
+        return None
+    return {column_name: ColumnSummary.from_dict(index["columns"][column_name]) for column_name in column_names}
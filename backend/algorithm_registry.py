@@ -1,13 +1,66 @@
+import importlib
+import threading
+
+
 class AlgorithmRegistry:
     algorithms = {}
+    _factories = {}
+    _lock = threading.Lock()
 
     @classmethod
     def register_algorithm(cls, name, algorithm_cls):
-        cls.algorithms[name] = algorithm_cls()  # Create an instance immediately
+        # algorithm_cls may be a class or an import path such as "algorithms.dp_gan.DPGAN".
+        # Import paths are only resolved on first use, so registering an algorithm does not
+        # pull its framework (TensorFlow, PyTorch, ...) into the process.
+        with cls._lock:
+            if cls._factories.get(name) == algorithm_cls:
+                return
+            cls._factories[name] = algorithm_cls
+            cls.algorithms.pop(name, None)
+
+    @classmethod
+    def registered_names(cls):
+        return list(cls._factories)
+
+    @classmethod
+    def is_loaded(cls, name):
+        return name in cls.algorithms
+
+    @staticmethod
+    def _resolve(algorithm_cls):
+        if isinstance(algorithm_cls, str):
+            module_name, _, class_name = algorithm_cls.rpartition('.')
+            module = importlib.import_module(module_name)
+            return getattr(module, class_name)
+        return algorithm_cls
 
     @classmethod
     def get_algorithm(cls, name):
         algorithm_instance = cls.algorithms.get(name)
-        if algorithm_instance is None:
-            raise ValueError(f"Algorithm {name} not registered")
+        if algorithm_instance is not None:
+            return algorithm_instance
+
+        with cls._lock:
+            algorithm_instance = cls.algorithms.get(name)
+            if algorithm_instance is None:
+                factory = cls._factories.get(name)
+                if factory is None:
+                    raise ValueError(f"Algorithm {name} not registered")
+                algorithm_instance = cls._resolve(factory)()  # Create the instance on first use
+                cls.algorithms[name] = algorithm_instance
         return algorithm_instance
+
+
+# Built-in algorithms, registered by import path so that none of them is imported up front
+DEFAULT_ALGORITHMS = {
+    "Gaussian Mechanism": "algorithms.gaussian_mechanism.GaussianMechanism",
+    "DP-GAN": "algorithms.dp_gan.DPGAN",
+    "DP-GAN Images": "algorithms.dp_gan_images.DPGANImages",
+    "Laplace Mechanism": "algorithms.laplace_mechanism.LaplaceMechanism",
+    "Opacus Synthesizer": "algorithms.opacus_synthesizer.OpacusSynthesizer",
+}
+
+
+def register_default_algorithms():
+    for name, algorithm_path in DEFAULT_ALGORITHMS.items():
+        AlgorithmRegistry.register_algorithm(name, algorithm_path)
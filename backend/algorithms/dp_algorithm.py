@@ -1,6 +1,17 @@
 from abc import ABC, abstractmethod
 
+class InvalidParametersError(ValueError):
+    """Raised by an algorithm when the data or parameters of a request do not fit it."""
+    pass
+
 class DPAlgorithm(ABC):
     @abstractmethod
-    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip):
+    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip, progress_callback=None):
+        # progress_callback, if given, is called as progress_callback(current, total, **metrics)
+        # as the work advances (e.g. once per training epoch). It may raise to abort the run.
         pass
+
+    @staticmethod
+    def report_progress(progress_callback, current, total, **metrics):
+        if progress_callback is not None:
+            progress_callback(current, total, **metrics)
@@ -2,15 +2,41 @@
 
 import numpy as np
 import tensorflow as tf
-from tensorflow_privacy.privacy.optimizers.dp_optimizer import DPGradientDescentOptimizer
-from tensorflow_privacy.privacy.dp_query.gaussian_query import GaussianSumQuery
-from tensorflow_privacy.privacy.analysis.compute_dp_sgd_privacy_lib import compute_dp_sgd_privacy_statement
-from tensorflow_privacy.privacy.analysis.compute_noise_from_budget_lib import compute_noise
-import tensorflow_probability as tfp
 
 from algorithms.dp_algorithm import DPAlgorithm
+from algorithms.dp_sgd import DPSGDOptimizer
+from algorithms.generator_store import generator_store
+from algorithms.input_pipeline import POISSON, build_input_pipeline
+from algorithms.lr_schedule import LearningRateSchedule
+from algorithms.private_targets import private_targets
+from privacy_accountant import calibrate_dp_sgd_noise, dp_sgd_epsilon as accounted_epsilon
 
 class DPGAN(DPAlgorithm):
+    # Training hyperparameters; part of the generator store key
+    EPOCHS = 10
+    BATCH_SIZE = 100
+    NOISE_DIM = 1
+    # Bump when the architecture or training procedure changes, to retire stored generators
+    STORE_VERSION = 1
+
+    def __init__(self, compile_step=True, jit_compile=False, target_epsilon_fraction=0.1, quantile_temperature=0.05,
+                 sampling=POISSON, store_generators=True):
+        # compile_step runs each training step as one tf.function graph instead of eagerly;
+        # jit_compile additionally compiles that graph with XLA.
+        self.compile_step = compile_step
+        self.jit_compile = jit_compile
+        # Share of epsilon spent on the private mean/median/min/max targets of the
+        # auxiliary losses; the rest goes to DP-SGD.
+        if not 0 < target_epsilon_fraction < 1:
+            raise ValueError("target_epsilon_fraction must be between 0 and 1")
+        self.target_epsilon_fraction = target_epsilon_fraction
+        # Width of the sigmoid step in the median loss, relative to the clipping range
+        self.quantile_temperature = quantile_temperature
+        # Batch sampling, see input_pipeline.py. The privacy statement assumes POISSON.
+        self.sampling = sampling
+        # Trained generators are kept so that repeat requests only sample from them
+        self.generator_store = generator_store if store_generators else None
+
     def build_generator(self):
         model = tf.keras.Sequential([
             tf.keras.layers.Dense(128, activation='relu', input_dim=1),
@@ -36,6 +62,15 @@ class DPGAN(DPAlgorithm):
         loss = tf.keras.losses.BinaryCrossentropy(from_logits=False)(labels, predictions)
         return loss
 
+    # Per-example discriminator loss. Real record i is paired with fake sample i, so
+    # clipping the pair's gradient bounds the influence of each real record.
+    @staticmethod
+    def discriminator_pair_loss(real_output, fake_output):
+        real_loss = tf.keras.losses.binary_crossentropy(tf.ones_like(real_output), real_output)
+        fake_loss = tf.keras.losses.binary_crossentropy(tf.zeros_like(fake_output), fake_output)
+        # Halved so the batch mean matches discriminator_loss over the combined batch
+        return 0.5 * (real_loss + fake_loss)
+
     # Loss function calculating generator's ability to fool discriminator
     @staticmethod
     def generator_loss(fake_output):
@@ -47,11 +82,13 @@ class DPGAN(DPAlgorithm):
         synthetic_data_avg = tf.reduce_mean(synthetic_data)
         return tf.abs(real_data_avg - synthetic_data_avg)
     
-    # Loss function calculating difference from median
+    # Loss function calculating difference from median. The share of synthetic values
+    # below the target median is estimated with a sigmoid step, which is differentiable
+    # and needs no sort; it is scaled by value_range to stay in rating units.
     @staticmethod
-    def median_rating_loss(real_data_median, synthetic_data):
-        synthetic_data_median = tfp.stats.percentile(synthetic_data, 50.0, interpolation='midpoint')  # Compute the median
-        return tf.abs(real_data_median - synthetic_data_median)
+    def median_rating_loss(real_data_median, synthetic_data, temperature, value_range):
+        share_below = tf.reduce_mean(tf.sigmoid((real_data_median - synthetic_data) / temperature))
+        return tf.abs(share_below - 0.5) * value_range
 
     # Loss function calculating difference from minimum
     @staticmethod
@@ -65,166 +102,227 @@ class DPGAN(DPAlgorithm):
         synthetic_data_max = tf.reduce_max(synthetic_data)
         return tf.abs(real_data_max - synthetic_data_max)
 
-    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip):
-        epochs = 10
-        batch_size = 100
-        noise_dim = 1
+    @staticmethod
+    def build_schedules():
+        # Both rates are halved every 5 epochs and whenever the epoch loss stops improving by 1%
+        discriminator_schedule = LearningRateSchedule(0.000099, decay_factor=0.5, decay_every_epochs=5,
+                                                      plateau_factor=0.5, plateau_threshold=0.01,
+                                                      name="discriminator_learning_rate")
+        generator_schedule = LearningRateSchedule(0.001, decay_factor=0.5, decay_every_epochs=5,
+                                                  plateau_factor=0.5, plateau_threshold=0.01,
+                                                  name="generator_learning_rate")
+        return discriminator_schedule, generator_schedule
+
+    @staticmethod
+    def build_optimizers(discriminator_schedule, generator_schedule, l2_norm_clip, noise_multiplier):
+        # The discriminator sees the private data, so it is trained with per-example DP-SGD
+        optimizer = discriminator_schedule.attach(DPSGDOptimizer(l2_norm_clip, noise_multiplier, discriminator_schedule.value))
+        non_dp_optimizer = generator_schedule.attach(tf.keras.optimizers.Adam(learning_rate=generator_schedule.value))
+        return optimizer, non_dp_optimizer
+
+    def make_train_step(self, generator, discriminator, optimizer, non_dp_optimizer, noise_dim, targets,
+                        lower_clip, upper_clip, expected_batch_size=None):
+        """
+        Build the function running one discriminator and one generator update on a batch.
+
+        targets holds the private 'mean', 'median', 'min' and 'max' of the real column,
+        which the auxiliary generator losses are measured against. With Poisson-sampled
+        batches, expected_batch_size is used to average the noisy discriminator gradient.
+
+        The returned function takes a float32 batch of shape (batch, 1) and returns the
+        (combined generator loss, discriminator loss) tensors. With compile_step it is a
+        tf.function, so the whole step runs as a single graph without host round trips.
+        Learning-rate changes made through the schedules do not require a rebuild.
+        """
+        # Targets are fixed for the whole run, so they are baked into the step as constants
+        real_data_avg = tf.constant(targets["mean"], dtype=tf.float32)
+        real_data_median = tf.constant(targets["median"], dtype=tf.float32)
+        real_data_min = tf.constant(targets["min"], dtype=tf.float32)
+        real_data_max = tf.constant(targets["max"], dtype=tf.float32)
+        value_range = float(max(upper_clip - lower_clip, 1e-6))
+        temperature = self.quantile_temperature * value_range
+
+        def train_step(real_data):
+            # Determine current batch size (may be smaller than the fixed batch size for the last batch in data)
+            current_batch_size = tf.shape(real_data)[0]
+
+            # Generate batch of synthetic data
+            noise = tf.random.normal([current_batch_size, noise_dim])
+            synthetic_data = generator(noise, training=True)
+
+            # Train the discriminator on per-example losses; the DP optimizer clips and
+            # noises each example's gradient in one vectorized pass
+            def d_per_example_loss():
+                real_output = discriminator(real_data, training=True)
+                fake_output = discriminator(synthetic_data, training=True)
+                return self.discriminator_pair_loss(real_output, fake_output)
+
+            d_loss = optimizer.minimize(d_per_example_loss, discriminator.trainable_variables,
+                                        normalizer=expected_batch_size)
+
+            # Train the generator
+            with tf.GradientTape() as gen_tape:
+                synthetic_data = generator(noise, training=True)
+                # Existing generator loss
+                predictions = discriminator(synthetic_data, training=False)
+                g_loss = self.generator_loss(predictions)
+                # Calculate average rating loss
+                avg_rating_loss = self.average_rating_loss(real_data_avg, synthetic_data)
+                median_rating_loss = self.median_rating_loss(real_data_median, synthetic_data, temperature, value_range)
+                min_rating_loss = self.min_rating_loss(real_data_min, synthetic_data)
+                max_rating_loss = self.max_rating_loss(real_data_max, synthetic_data)
+                # Combine losses
+                combined_g_loss = avg_rating_loss + median_rating_loss + min_rating_loss + max_rating_loss + g_loss
+
+            # Compute and apply gradients through standard optimizer
+            g_gradients = gen_tape.gradient(combined_g_loss, generator.trainable_variables)
+            non_dp_optimizer.apply_gradients(zip(g_gradients, generator.trainable_variables))
+            return combined_g_loss, d_loss
+
+        if not self.compile_step:
+            return train_step
+        # A fixed signature keeps the smaller last batch from triggering a retrace
+        return tf.function(
+            train_step,
+            input_signature=[tf.TensorSpec(shape=[None, 1], dtype=tf.float32)],
+            jit_compile=self.jit_compile,
+        )
+
+    def training_params(self, epsilon, delta, lower_clip, upper_clip):
+        # The clipping bounds are included: the private loss targets are computed on the
+        # column clamped to them, so they shape the trained generator.
+        return {
+            "algorithm": "DP-GAN",
+            "version": self.STORE_VERSION,
+            "epsilon": float(epsilon),
+            "delta": float(delta),
+            "lower_clip": float(lower_clip),
+            "upper_clip": float(upper_clip),
+            "epochs": self.EPOCHS,
+            "batch_size": self.BATCH_SIZE,
+            "noise_dim": self.NOISE_DIM,
+            "target_epsilon_fraction": self.target_epsilon_fraction,
+            "quantile_temperature": self.quantile_temperature,
+            "sampling": self.sampling,
+        }
+
+    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip, progress_callback=None,
+                                dataset=None):
+        # dataset, if given, names the data's dataset so its stored generators are removed with it
+        data = np.asarray(data).ravel()
+
+        key = None
+        if self.generator_store is not None:
+            key = self.generator_store.key(data, **self.training_params(epsilon, delta, lower_clip, upper_clip))
+            generator, _ = self.generator_store.load(key, self.build_generator, dataset=dataset)
+            if generator is not None:
+                # Sampling a generator is post-processing and spends no further budget
+                print(f"Reusing stored generator {key}")
+                self.report_progress(progress_callback, 1, 1, reused_generator=True)
+                return self.sample_generator(generator, sample_size, lower_clip, upper_clip)
+
+        generator, metadata = self.train_generator(data, epsilon, delta, lower_clip, upper_clip, progress_callback)
+        if key is not None:
+            self.generator_store.save(key, generator, metadata, dataset=dataset)
+        return self.sample_generator(generator, sample_size, lower_clip, upper_clip)
+
+    def sample_generator(self, generator, sample_size, lower_clip, upper_clip):
+        # Generate final synthetic data
+        synthetic_data = generator.predict(np.random.normal(size=(sample_size, self.NOISE_DIM)))
+
+        # Apply clipping to the synthetic data
+        synthetic_data_clipped = np.clip(synthetic_data, lower_clip, upper_clip)
+
+        synthetic_data_rounded = np.rint(synthetic_data_clipped)
+
+        # Convert the rounded data to integer type
+        synthetic_data_integers = synthetic_data_rounded.astype(int)
+
+        return synthetic_data_integers
+
+    def train_generator(self, data, epsilon, delta, lower_clip, upper_clip, progress_callback=None):
+        """
+        Train a generator on a 1-D column with the given privacy budget.
+
+        Returns:
+        tuple: (generator, metadata) where metadata describes the run for the generator store.
+        """
+        epochs = self.EPOCHS
+        batch_size = self.BATCH_SIZE
+        noise_dim = self.NOISE_DIM
         print_interval = 1
-        # Convert data to TensorFlow Dataset
-        data = tf.data.Dataset.from_tensor_slices(data).batch(batch_size)
         number_of_examples = len(data)
-        learning_rate_reduction_factor = 0.5  # Factor to reduce learning rate
-        reduce_every_epochs = 5  # Reduce learning rate every 5 epochs
-        # Variables to track the minimum loss
-        min_g_loss = float('inf')
-        min_d_loss = float('inf')
-        loss_reduction_threshold = 0.00000001  # Threshold to trigger learning rate reduction
 
-        # Calculate noise multiplier
-        noise_multiplier = compute_noise(number_of_examples, batch_size, epsilon, epochs, delta, noise_lbd=1e-1)
+        # Split the budget: a small share for the loss targets, the rest for DP-SGD.
+        # Both mechanisms are pure epsilon-DP or (epsilon, delta)-DP on the same data, so
+        # the total is their sum under sequential composition.
+        target_epsilon = epsilon * self.target_epsilon_fraction
+        dp_sgd_epsilon = epsilon - target_epsilon
+        targets = private_targets(data, target_epsilon, lower_clip, upper_clip)
+        print(f"Private loss targets (epsilon={target_epsilon}): {targets}")
+
+        # Float32 batches shaped (batch, 1), prepared in the background during training
+        data = build_input_pipeline(data, batch_size, sampling=self.sampling,
+                                    preprocess=lambda batch: tf.reshape(tf.cast(batch, tf.float32), [-1, 1]))
+
+        # Calculate noise multiplier; memoized, so repeated runs on the same data skip the search
+        noise_multiplier = calibrate_dp_sgd_noise(number_of_examples, batch_size, epochs, dp_sgd_epsilon, delta)
 
         l2_norm_clip = 1.0
 
-        # Calculate the privacy statement
-        # Use compute_dp_sgd_privacy_statement to get the privacy statement
-        privacy_statement = compute_dp_sgd_privacy_statement(
-            number_of_examples=number_of_examples,
-            batch_size=batch_size,
-            num_epochs=epochs,
-            noise_multiplier=noise_multiplier,
-            delta=delta,
-            used_microbatching=True,  # Assuming microbatching is used
-            max_examples_per_user=1,  # Assuming no limit on examples per user
-        )
-        print(privacy_statement)
+        # Every example is clipped on its own and appears in the data once
+        print(f"DP-SGD with noise multiplier {noise_multiplier:.3f} over {epochs} epochs satisfies "
+              f"({accounted_epsilon(number_of_examples, batch_size, epochs, noise_multiplier, delta):.3f}, {delta})-DP")
 
         # Build the generator and discriminator
         generator = self.build_generator()
         discriminator = self.build_discriminator()
 
-        # Initial learning rates
-        lr_discriminator = 0.000099
-        lr_generator = 0.001
-
-        # Initial Optimizers
-        dp_sum_query = GaussianSumQuery(l2_norm_clip, noise_multiplier)
-        optimizer = DPGradientDescentOptimizer(dp_sum_query=dp_sum_query, num_microbatches=1, learning_rate=lr_discriminator)
-        non_dp_optimizer = tf.keras.optimizers.Adam(learning_rate=lr_generator)
-
-        # Compile the discriminator with the DP optimizer
-        discriminator.compile(optimizer=optimizer, loss='binary_crossentropy')
-
-        # Variables to track the minimum loss
-        min_g_loss = float('inf')
-        min_d_loss = float('inf')
-        loss_reduction_threshold = 0.01  # Threshold to trigger learning rate reduction
+        # Learning rates and optimizers; the optimizers are kept for the whole run
+        discriminator_schedule, generator_schedule = self.build_schedules()
+        optimizer, non_dp_optimizer = self.build_optimizers(discriminator_schedule, generator_schedule,
+                                                            l2_norm_clip, noise_multiplier)
+        train_step = self.make_train_step(generator, discriminator, optimizer, non_dp_optimizer, noise_dim,
+                                          targets, lower_clip, upper_clip,
+                                          expected_batch_size=batch_size if self.sampling == POISSON else None)
 
         # GAN training loop
         for epoch in range(epochs):
-            total_g_loss = 0
-            total_d_loss = 0
+            # Losses are summed on the device and only read back once per epoch
+            total_g_loss = tf.zeros([])
+            total_d_loss = tf.zeros([])
             num_batches = 0
             # Update learning rate based on scheduler
-            if (epoch + 1) % reduce_every_epochs == 0:
-                lr_discriminator *= learning_rate_reduction_factor
-                lr_generator *= learning_rate_reduction_factor
-
-                # Reinitialize optimizers with new learning rates
-                optimizer = DPGradientDescentOptimizer(dp_sum_query=dp_sum_query, num_microbatches=1, learning_rate=lr_discriminator)
-                non_dp_optimizer = tf.keras.optimizers.Adam(learning_rate=lr_generator)
+            discriminator_schedule.on_epoch_begin(epoch)
+            generator_schedule.on_epoch_begin(epoch)
 
             for real_data in data:
-                # Reshape real_data if it is 1-dimensional
-                if len(real_data.shape) == 1:
-                    real_data = tf.expand_dims(real_data, axis=-1)
-
-                # Ensure real_data is a float32 tensor if it's not already
-                real_data = tf.cast(real_data, tf.float32)
-
-                # Determine current batch size (may be smaller than the fixed batch size for the last batch in data)
-                current_batch_size = tf.shape(real_data)[0]
-                # Calculate average rating of real data
-                real_data_avg = tf.reduce_mean(real_data)
-                real_data_median = tfp.stats.percentile(real_data, 50.0, interpolation='midpoint')  # Compute the median
-                real_data_min = tf.reduce_min(real_data)
-                real_data_max = tf.reduce_max(real_data)
-
-                # Generate batch of synthetic data
-                noise = tf.random.normal([current_batch_size, noise_dim])
-                synthetic_data = generator(noise, training=True)
-
-                # Combine real and synthetic data
-                combined_data = tf.concat([real_data, synthetic_data], axis=0)
-                # Dynamically create labels for real and synthetic data
-                labels_real = tf.ones((current_batch_size, 1), dtype=tf.float32)
-                labels_synthetic = tf.zeros((current_batch_size, 1), dtype=tf.float32)
-                labels_combined = tf.concat([labels_real, labels_synthetic], axis=0)
-
-                # Train the discriminator
-                with tf.GradientTape(persistent=True) as disc_tape:
-                    discriminator_output = discriminator(combined_data, training=True)
-                    d_loss = self.discriminator_loss(labels_combined, discriminator_output)
-                    d_loss_value = self.discriminator_loss(labels_combined, discriminator_output)
-                    d_gradients = optimizer.compute_gradients(d_loss, discriminator.trainable_variables, gradient_tape=disc_tape)
-
-                # Apply gradients through DP optimizer
-                optimizer.apply_gradients(d_gradients)
-
-                # Train the generator
-                with tf.GradientTape(persistent=True) as gen_tape:
-                    synthetic_data = generator(noise, training=True)
-                    # Existing generator loss
-                    predictions = discriminator(synthetic_data, training=False)
-                    g_loss = self.generator_loss(predictions)
-                    # Calculate average rating loss
-                    avg_rating_loss = self.average_rating_loss(real_data_avg, synthetic_data)
-                    median_rating_loss = self.median_rating_loss(real_data_median, synthetic_data)
-                    min_rating_loss = self.min_rating_loss(real_data_min, synthetic_data)
-                    max_rating_loss = self.max_rating_loss(real_data_max, synthetic_data)
-                    # Combine losses
-                    combined_g_loss = avg_rating_loss + median_rating_loss + min_rating_loss + max_rating_loss + g_loss
-                    # Compute and apply gradients
-
-                # Compute and apply gradients through standard optimizer
-                g_gradients = gen_tape.gradient(combined_g_loss, generator.trainable_variables)
-                non_dp_optimizer.apply_gradients(zip(g_gradients, generator.trainable_variables))
-                total_g_loss += combined_g_loss.numpy()
-                total_d_loss += d_loss_value.numpy()
+                combined_g_loss, d_loss_value = train_step(real_data)
+                total_g_loss += combined_g_loss
+                total_d_loss += d_loss_value
                 num_batches += 1
-            
+
             # Calculate average loss for the epoch
-            avg_g_loss = total_g_loss / num_batches
-            avg_d_loss = total_d_loss / num_batches
+            avg_g_loss = float(total_g_loss.numpy()) / max(num_batches, 1)
+            avg_d_loss = float(total_d_loss.numpy()) / max(num_batches, 1)
 
             # Print progress
             if (epoch + 1) % print_interval == 0:
                 print(f"Epoch {epoch + 1}, Generator Loss: {avg_g_loss}, Discriminator Loss: {avg_d_loss}")
+            self.report_progress(progress_callback, epoch + 1, epochs,
+                                 generator_loss=float(avg_g_loss), discriminator_loss=float(avg_d_loss))
 
-            # Check if the loss reduction is below the threshold and update learning rates
-            if avg_g_loss > min_g_loss * (1 - loss_reduction_threshold):
-                lr_generator *= learning_rate_reduction_factor
-                non_dp_optimizer = tf.keras.optimizers.Adam(learning_rate=lr_generator)
-
-            if avg_d_loss > min_d_loss * (1 - loss_reduction_threshold):
-                lr_discriminator *= learning_rate_reduction_factor
-                optimizer = DPGradientDescentOptimizer(dp_sum_query=dp_sum_query, num_microbatches=1, learning_rate=lr_discriminator)
-
-            # Update minimum loss if current average loss is lower
-            min_g_loss = min(min_g_loss, avg_g_loss)
-            min_d_loss = min(min_d_loss, avg_d_loss)
+            # Reduce the learning rates if the loss reduction is below the threshold
+            generator_schedule.on_epoch_end(avg_g_loss)
+            discriminator_schedule.on_epoch_end(avg_d_loss)
 
             # Print current learning rates
-            print(f"Current learning rates - Generator: {lr_generator}, Discriminator: {lr_discriminator}")
-
-        # Generate final synthetic data
-        synthetic_data = generator.predict(np.random.normal(size=(sample_size, 1)))
-
-        # Apply clipping to the synthetic data
-        synthetic_data_clipped = np.clip(synthetic_data, lower_clip, upper_clip)
-
-        synthetic_data_rounded = np.rint(synthetic_data_clipped)
-
-        # Convert the rounded data to integer type
-        synthetic_data_integers = synthetic_data_rounded.astype(int)
-
-        return synthetic_data_integers
+            print(f"Current learning rates - Generator: {generator_schedule.value}, Discriminator: {discriminator_schedule.value}")
+
+        metadata = {
+            **self.training_params(epsilon, delta, lower_clip, upper_clip),
+            "number_of_examples": number_of_examples,
+            "noise_multiplier": float(noise_multiplier),
+            "targets": targets,
+        }
+        return generator, metadata
@@ -1,16 +1,29 @@
 # dp_gan.py
 
+import time
+
 import numpy as np
 import tensorflow as tf
-from tensorflow_privacy.privacy.optimizers.dp_optimizer import DPGradientDescentOptimizer
-from tensorflow_privacy.privacy.dp_query.gaussian_query import GaussianSumQuery
-from tensorflow_privacy.privacy.analysis.compute_dp_sgd_privacy_lib import compute_dp_sgd_privacy_statement
-from tensorflow_privacy.privacy.analysis.compute_noise_from_budget_lib import compute_noise
-import tensorflow_probability as tfp
 
 from algorithms.dp_algorithm import DPAlgorithm
+from algorithms.dp_sgd import DPSGDOptimizer
+from algorithms.input_pipeline import POISSON, build_input_pipeline
+from algorithms.lr_schedule import LearningRateSchedule
+from privacy_accountant import calibrate_dp_sgd_noise, dp_sgd_epsilon as accounted_epsilon
 
 class DPGANImages(DPAlgorithm):
+    def __init__(self, compile_step=True, label_epsilon_fraction=0.05, vectorized=True, num_classes=10):
+        # compile_step runs each training step as one tf.function graph instead of eagerly
+        self.compile_step = compile_step
+        # Share of epsilon spent on the label histogram; the rest goes to DP-SGD
+        if not 0 < label_epsilon_fraction < 1:
+            raise ValueError("label_epsilon_fraction must be between 0 and 1")
+        self.label_epsilon_fraction = label_epsilon_fraction
+        # Compute per-example gradients with pfor instead of a loop over the batch
+        self.vectorized = vectorized
+        # Public label domain (0 .. num_classes - 1) when a request does not list its classes
+        self.num_classes = num_classes
+
     def build_cnn_generator(self):
         model = tf.keras.Sequential()
         model.add(tf.keras.layers.Dense(7*7*256, use_bias=False, input_shape=(100,)))
@@ -56,82 +69,166 @@ class DPGANImages(DPAlgorithm):
     def generator_loss(fake_output):
         return tf.keras.losses.BinaryCrossentropy(from_logits=False)(tf.ones_like(fake_output), fake_output)
 
-    def generate_synthetic_labels(self, labels, sample_size):
-        # Implement logic to generate synthetic labels
-        # This is a placeholder, replace with your actual logic
-        synthetic_labels = np.random.choice(labels, size=sample_size)
+    # Per-example discriminator loss: real image i is paired with generated image i, so
+    # clipping the pair's gradient bounds the influence of each real image
+    @staticmethod
+    def discriminator_pair_loss(real_output, fake_output):
+        real_loss = tf.keras.losses.binary_crossentropy(tf.ones_like(real_output), real_output)
+        fake_loss = tf.keras.losses.binary_crossentropy(tf.zeros_like(fake_output), fake_output)
+        return real_loss + fake_loss
+
+    def generate_synthetic_labels(self, labels, sample_size, epsilon, classes=None):
+        # Sample labels from an epsilon-DP histogram of the real labels (Laplace noise on
+        # every count; adding or removing one image changes one count by 1). The classes
+        # come from a public domain, never from the data, so a class with a single image
+        # is not revealed by appearing in the output; labels outside it are ignored.
+        classes = np.asarray(classes if classes is not None else np.arange(self.num_classes))
+        order = np.argsort(classes, kind='stable')
+        sorted_classes = classes[order]
+        labels = np.asarray(labels).ravel()
+        positions = np.minimum(np.searchsorted(sorted_classes, labels), len(classes) - 1)
+        known = sorted_classes[positions] == labels
+        counts = np.bincount(order[positions[known]], minlength=len(classes))
+        noisy_counts = np.maximum(counts + np.random.laplace(0, 1 / epsilon, size=len(counts)), 0)
+        if noisy_counts.sum() == 0:
+            noisy_counts = np.ones(len(classes))
+        synthetic_labels = np.random.choice(classes, size=sample_size, p=noisy_counts / noisy_counts.sum())
         return synthetic_labels
     
+    @staticmethod
+    def preprocess_images(images):
+        # Normalize the images to [-1, 1] range as we use tanh activation in the last layer of the generator
+        images = (tf.cast(images, tf.float32) - 127.5) / 127.5
+        # Convert to appropriate tensor shape
+        if images.shape.rank == 3:
+            images = tf.expand_dims(images, axis=-1)
+        return images
+
     def post_process_images(self, images):
         # Assuming images are in the range [-1, 1]
         # Convert to range [0, 255] and change dtype to uint8
         images = ((images + 1) * 127.5).astype(np.uint8)
         return images
     
-    def generate_synthetic_data(self, train_images, train_labels, sample_size, epsilon, delta, lower_clip, upper_clip):
-        # Normalize the images to [-1, 1] range as we use tanh activation in the last layer of the generator
-        train_images = (train_images - 127.5) / 127.5
-        # Convert to appropriate tensor shape
-        train_images = np.expand_dims(train_images, axis=-1)
-        
+    def build_optimizers(self, l2_norm_clip, noise_multiplier):
+        # Learning rates are halved after 5 epochs without a 1% improvement
+        generator_schedule = LearningRateSchedule(1e-4, plateau_factor=0.5, plateau_patience=5,
+                                                  min_learning_rate=1e-6, name="generator_learning_rate")
+        discriminator_schedule = LearningRateSchedule(1e-4, plateau_factor=0.5, plateau_patience=5,
+                                                      min_learning_rate=1e-6, name="discriminator_learning_rate")
+        generator_optimizer = generator_schedule.attach(tf.keras.optimizers.Adam(generator_schedule.value))
+        # The discriminator sees the real images, so its gradients go through DP-SGD first
+        discriminator_optimizer = discriminator_schedule.attach(DPSGDOptimizer(
+            l2_norm_clip, noise_multiplier, discriminator_schedule.value,
+            vectorized=self.vectorized, base_optimizer=tf.keras.optimizers.Adam,
+        ))
+        return generator_schedule, discriminator_schedule, generator_optimizer, discriminator_optimizer
+
+    def make_train_step(self, generator, discriminator, generator_optimizer, discriminator_optimizer, noise_dim,
+                        expected_batch_size):
+        """
+        Build the function running one discriminator and one generator update on a batch.
+
+        The returned function takes a normalized float32 image batch of shape
+        (batch, 28, 28, 1) and returns the (generator loss, discriminator loss) tensors.
+        """
+        def train_step(image_batch):
+            # One generated image per real image; Poisson batches vary in size
+            noise = tf.random.normal([tf.shape(image_batch)[0], noise_dim])
+            generated_images = generator(noise, training=True)
+
+            # Start with discriminator training
+            def disc_per_example_loss():
+                real_output = discriminator(image_batch, training=True)
+                fake_output = discriminator(generated_images, training=True)
+                return self.discriminator_pair_loss(real_output, fake_output)
+
+            disc_loss = discriminator_optimizer.minimize(disc_per_example_loss, discriminator.trainable_variables,
+                                                         normalizer=expected_batch_size)
+
+            # Generator training
+            with tf.GradientTape() as gen_tape:
+                generated_images = generator(noise, training=True)
+                fake_output = discriminator(generated_images, training=True)
+                gen_loss = self.generator_loss(fake_output)
+
+            gradients_of_generator = gen_tape.gradient(gen_loss, generator.trainable_variables)
+            generator_optimizer.apply_gradients(zip(gradients_of_generator, generator.trainable_variables))
+            return gen_loss, disc_loss
+
+        if not self.compile_step:
+            return train_step
+        return tf.function(train_step, reduce_retracing=True)
+
+    def generate_synthetic_data(self, train_images, train_labels, sample_size, epsilon, delta, lower_clip, upper_clip,
+                                progress_callback=None, classes=None):
         # Hyperparameters
         epochs = 50
         batch_size = 256
         noise_dim = 100
         log_interval = 10
+        l2_norm_clip = 1.0
+        number_of_examples = len(train_images)
+
+        # Split the budget between the label histogram and DP-SGD
+        label_epsilon = epsilon * self.label_epsilon_fraction
+        dp_sgd_epsilon = epsilon - label_epsilon
+
+        # Calculate noise multiplier for the discriminator
+        noise_multiplier = calibrate_dp_sgd_noise(number_of_examples, batch_size, epochs, dp_sgd_epsilon, delta)
+        print(f"DP-SGD with noise multiplier {noise_multiplier:.3f} over {epochs} epochs satisfies "
+              f"({accounted_epsilon(number_of_examples, batch_size, epochs, noise_multiplier, delta):.3f}, {delta})-DP")
+
+        # The pipeline is built once; Poisson batches are normalized while training runs
+        image_batches = build_input_pipeline(train_images, batch_size, sampling=POISSON,
+                                             preprocess=self.preprocess_images)
 
         # Build the generator and discriminator
         generator = self.build_cnn_generator()
         discriminator = self.build_cnn_discriminator()
 
-        # Optimizers
-        generator_optimizer = tf.keras.optimizers.Adam(1e-4)
-        discriminator_optimizer = tf.keras.optimizers.Adam(1e-4)
-
-        # Loss function
-        cross_entropy = tf.keras.losses.BinaryCrossentropy()
+        generator_schedule, discriminator_schedule, generator_optimizer, discriminator_optimizer = \
+            self.build_optimizers(l2_norm_clip, noise_multiplier)
+        train_step = self.make_train_step(generator, discriminator, generator_optimizer, discriminator_optimizer,
+                                          noise_dim, expected_batch_size=batch_size)
 
         # Training loop
         for epoch in range(epochs):
-            for batch_index, image_batch in enumerate(tf.data.Dataset.from_tensor_slices(train_images).batch(batch_size)):
-                # Start with discriminator training
-                noise = tf.random.normal([batch_size, noise_dim])
-                with tf.GradientTape() as disc_tape:
-                    generated_images = generator(noise, training=True)
-                    real_output = discriminator(image_batch, training=True)
-                    fake_output = discriminator(generated_images, training=True)
-
-                    real_loss = cross_entropy(tf.ones_like(real_output), real_output)
-                    fake_loss = cross_entropy(tf.zeros_like(fake_output), fake_output)
-                    disc_loss = real_loss + fake_loss
-
-                gradients_of_discriminator = disc_tape.gradient(disc_loss, discriminator.trainable_variables)
-                discriminator_optimizer.apply_gradients(zip(gradients_of_discriminator, discriminator.trainable_variables))
-
-                # Generator training
-                with tf.GradientTape() as gen_tape:
-                    generated_images = generator(noise, training=True)
-                    fake_output = discriminator(generated_images, training=True)
-                    gen_loss = cross_entropy(tf.ones_like(fake_output), fake_output)
-
-                gradients_of_generator = gen_tape.gradient(gen_loss, generator.trainable_variables)
-                generator_optimizer.apply_gradients(zip(gradients_of_generator, generator.trainable_variables))
+            total_gen_loss = tf.zeros([])
+            total_disc_loss = tf.zeros([])
+            num_batches = 0
+            num_images = 0
+            epoch_start = time.perf_counter()
+            for batch_index, image_batch in enumerate(image_batches):
+                gen_loss, disc_loss = train_step(image_batch)
+                total_gen_loss += gen_loss
+                total_disc_loss += disc_loss
+                num_batches += 1
+                num_images += int(image_batch.shape[0])
 
                 # Log the progress (optional)
                 if batch_index % log_interval == 0:
                     print(f'Epoch {epoch+1}/{epochs}, Batch {batch_index}, Gen Loss: {gen_loss.numpy()}, Disc Loss: {disc_loss.numpy()}')
 
-        # Placeholder for generating synthetic labels (you'll need to implement this)
-        synthetic_train_labels = self.generate_synthetic_labels(train_labels, sample_size)
-        
+            avg_gen_loss = float(total_gen_loss.numpy()) / max(num_batches, 1)
+            avg_disc_loss = float(total_disc_loss.numpy()) / max(num_batches, 1)
+            images_per_sec = num_images / (time.perf_counter() - epoch_start)
+            print(f'Epoch {epoch+1}/{epochs}: {images_per_sec:.1f} images/sec')
+            generator_schedule.on_epoch_end(avg_gen_loss)
+            discriminator_schedule.on_epoch_end(avg_disc_loss)
+
+            self.report_progress(progress_callback, epoch + 1, epochs,
+                                 generator_loss=avg_gen_loss, discriminator_loss=avg_disc_loss,
+                                 images_per_sec=images_per_sec)
+
         # After training is complete, generate synthetic images
         noise = tf.random.normal([sample_size, noise_dim])
         synthetic_train_images = generator(noise, training=False).numpy()
 
         # Generate labels for synthetic images
-        synthetic_train_labels = self.generate_synthetic_labels(train_labels, sample_size)
+        synthetic_train_labels = self.generate_synthetic_labels(train_labels, sample_size, label_epsilon, classes)
 
         synthetic_train_images = self.post_process_images(synthetic_train_images)
 
         # Return only train images and labels
-        return synthetic_train_images, synthetic_train_labels
\ No newline at end of file
+        return synthetic_train_images, synthetic_train_labels
@@ -0,0 +1,92 @@
+# dp_sgd.py
+#
+# DP-SGD with true per-example clipping. The per-example gradients of a batch are taken
+# in one vectorized pass (the Jacobian of the per-example loss vector, computed with
+# pfor), clipped to l2_norm_clip, summed, noised with N(0, (noise_multiplier * l2_norm_clip)^2)
+# and averaged, then applied with plain SGD or another base optimizer. Feeding the
+# private gradient to e.g. Adam is post-processing and costs no extra privacy.
+
+import tensorflow as tf
+
+
+def per_example_gradients(tape, per_example_losses, variables, vectorized=True):
+    """
+    Gradients of every entry of per_example_losses with respect to variables.
+
+    Returns:
+    list: One tensor of shape [batch, *variable.shape] per variable.
+    """
+    return tape.jacobian(
+        per_example_losses, variables,
+        unconnected_gradients=tf.UnconnectedGradients.ZERO,
+        experimental_use_pfor=vectorized,
+    )
+
+
+def clip_and_noise(gradients, l2_norm_clip, noise_multiplier, normalizer):
+    """
+    Clip per-example gradients, sum them, add Gaussian noise and divide by normalizer.
+
+    Parameters:
+    gradients (list): Per-example gradients as returned by per_example_gradients.
+    l2_norm_clip (float): Bound on each example's gradient norm across all variables.
+    noise_multiplier (float): Noise standard deviation relative to l2_norm_clip.
+    normalizer (tf.Tensor): Divisor of the noisy sum, normally the (expected) batch size.
+
+    Returns:
+    list: The private gradient of every variable.
+    """
+    batch_size = tf.shape(gradients[0])[0]
+    squared_norms = tf.add_n([
+        tf.reduce_sum(tf.reshape(tf.square(gradient), [batch_size, -1]), axis=1) for gradient in gradients
+    ])
+    # Per-example factor that brings the gradient norm down to at most l2_norm_clip
+    scale = tf.minimum(1.0, l2_norm_clip / tf.maximum(tf.sqrt(squared_norms), 1e-12))
+
+    private_gradients = []
+    for gradient in gradients:
+        clipped_sum = tf.tensordot(scale, gradient, axes=1)
+        noise = tf.random.normal(tf.shape(clipped_sum), stddev=l2_norm_clip * noise_multiplier)
+        private_gradients.append((clipped_sum + noise) / normalizer)
+    return private_gradients
+
+
+class DPSGDOptimizer:
+    def __init__(self, l2_norm_clip, noise_multiplier, learning_rate, vectorized=True, base_optimizer=tf.keras.optimizers.SGD):
+        self.l2_norm_clip = l2_norm_clip
+        self.noise_multiplier = noise_multiplier
+        self.vectorized = vectorized
+        self.optimizer = base_optimizer(learning_rate=learning_rate)
+
+    # Exposed so that a LearningRateSchedule can be attached like to any Keras optimizer
+    @property
+    def learning_rate(self):
+        return self.optimizer.learning_rate
+
+    @learning_rate.setter
+    def learning_rate(self, value):
+        self.optimizer.learning_rate = value
+
+    def minimize(self, per_example_loss_fn, variables, normalizer=None):
+        """
+        Take one DP-SGD step.
+
+        Parameters:
+        per_example_loss_fn (callable): Returns a loss vector with one entry per private example.
+        variables (list): Variables to update.
+        normalizer (tf.Tensor, optional): Divisor of the noisy gradient sum; defaults to the
+            batch size. Poisson-sampled batches should pass the expected batch size.
+
+        Returns:
+        tf.Tensor: Mean of the per-example losses.
+        """
+        with tf.GradientTape() as tape:
+            per_example_losses = per_example_loss_fn()
+        gradients = per_example_gradients(tape, per_example_losses, variables, vectorized=self.vectorized)
+
+        if normalizer is None:
+            normalizer = tf.cast(tf.shape(per_example_losses)[0], tf.float32)
+        private_gradients = clip_and_noise(gradients, self.l2_norm_clip, self.noise_multiplier,
+                                           tf.maximum(tf.cast(normalizer, tf.float32), 1.0))
+        self.optimizer.apply_gradients(zip(private_gradients, variables))
+        return tf.reduce_mean(per_example_losses)
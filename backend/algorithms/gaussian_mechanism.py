@@ -2,8 +2,15 @@
 
 import numpy as np
 from algorithms.dp_algorithm import DPAlgorithm
+from algorithms.rowwise_noise import DEFAULT_CHUNK_SIZE, add_rowwise_noise
 
 class GaussianMechanism(DPAlgorithm):
+    def __init__(self, row_wise=True, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Row-wise mode noises each record once, in chunks of chunk_size records.
+        # The legacy matrix mode draws a (sample_size, len(data)) noise matrix.
+        self.row_wise = row_wise
+        self.chunk_size = chunk_size
+
     def generate_noisy_mean(self, data, epsilon, delta):
         # Calculate the actual mean of the data
         actual_mean = np.mean(data)
@@ -19,9 +26,16 @@ class GaussianMechanism(DPAlgorithm):
 
         return noisy_mean
 
-    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip):
+    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip, progress_callback=None):
         # Implementation of synthetic data generation using the Gaussian mechanism
         noise_scale = np.sqrt(2 * np.log(1.25 / delta)) / epsilon
+
+        if self.row_wise:
+            return add_rowwise_noise(
+                data, sample_size, lambda n: np.random.normal(0, noise_scale, size=n),
+                lower_clip, upper_clip, chunk_size=self.chunk_size, progress_callback=progress_callback
+            )
+
         synthetic_data = data + np.random.normal(0, noise_scale, size=(sample_size, len(data)))
         # Apply clipping to the synthetic data
 
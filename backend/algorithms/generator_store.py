@@ -0,0 +1,179 @@
+# generator_store.py
+#
+# On-disk store of trained generators. A generator trained with a given privacy budget
+# can be sampled any number of times without spending more budget (sampling is
+# post-processing), so repeat requests on the same data and settings reuse it instead
+# of retraining. Every entry lists the datasets it was trained or reused for, and is
+# removed once all of them have been deleted.
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from sidecar import META_DIR
+
+DEFAULT_STORE_DIR = os.path.join('data', META_DIR, 'generators')
+
+
+def data_digest(data):
+    """Hash of a column's values, independent of the file it was read from."""
+    values = np.ascontiguousarray(np.asarray(data, dtype=np.float64).ravel())
+    digest = hashlib.sha256()
+    digest.update(str(values.shape).encode())
+    digest.update(memoryview(values).cast('B'))
+    return digest.hexdigest()
+
+
+class GeneratorStore:
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        self.directory = directory
+
+    @classmethod
+    def from_env(cls):
+        return cls(directory=os.environ.get("GENERATOR_STORE_DIR", DEFAULT_STORE_DIR))
+
+    @staticmethod
+    def key(data, **params):
+        """
+        Store key of a generator trained on data with the given hyperparameters.
+
+        Parameters:
+        data (array-like): The training column.
+        params: Everything else that influences training (budget, bounds, model settings).
+            Values must be JSON-serializable.
+
+        Returns:
+        str: Hex digest.
+        """
+        digest = hashlib.sha256(data_digest(data).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.weights.h5', base + '.json'
+
+    def load(self, key, build_model, dataset=None):
+        """
+        Load a stored generator.
+
+        Parameters:
+        key (str): Key from GeneratorStore.key.
+        build_model (callable): Returns a freshly built model of the same architecture.
+        dataset (str, optional): Dataset the generator is reused for; recorded with the entry.
+
+        Returns:
+        tuple: (model, metadata), or (None, None) if nothing usable is stored.
+        """
+        weights_path, metadata_path = self._paths(key)
+        if not (os.path.isfile(weights_path) and os.path.isfile(metadata_path)):
+            return None, None
+        try:
+            model = build_model()
+            model.load_weights(weights_path)
+            with open(metadata_path) as f:
+                metadata = json.load(f)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable stored generator {key}: {e}")
+            return None, None
+        if dataset is not None and dataset not in metadata.get('datasets', []):
+            metadata['datasets'] = metadata.get('datasets', []) + [dataset]
+            self._write_metadata(metadata_path, metadata)
+        return model, metadata
+
+    @staticmethod
+    def _write_metadata(metadata_path, metadata):
+        fd, tmp_metadata = tempfile.mkstemp(dir=os.path.dirname(metadata_path), suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_metadata, metadata_path)
+
+    def save(self, key, model, metadata=None, dataset=None):
+        """
+        Store model's weights and metadata under key, replacing any previous entry.
+
+        dataset, if given, is the dataset the generator was trained on; the entry is
+        removed by evict_dataset once it and every dataset it was reused for are deleted.
+        """
+        weights_path, metadata_path = self._paths(key)
+        os.makedirs(os.path.dirname(weights_path), exist_ok=True)
+
+        # Write to temporary files first so readers never see a partial entry
+        fd, tmp_weights = tempfile.mkstemp(dir=os.path.dirname(weights_path), suffix='.weights.h5')
+        os.close(fd)
+        try:
+            model.save_weights(tmp_weights)
+            os.replace(tmp_weights, weights_path)
+        finally:
+            if os.path.exists(tmp_weights):
+                os.remove(tmp_weights)
+
+        metadata = dict(metadata or {})
+        if dataset is not None:
+            metadata['datasets'] = [dataset]
+        self._write_metadata(metadata_path, metadata)
+
+    def _entries(self):
+        # (weights path, metadata path, metadata) of every stored generator
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                # Keys are hex digests; mkstemp's partial files start with 'tmp'
+                if not name.endswith('.json') or name.startswith('tmp'):
+                    continue
+                metadata_path = os.path.join(prefix_dir, name)
+                try:
+                    with open(metadata_path) as f:
+                        metadata = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                yield metadata_path[:-len('.json')] + '.weights.h5', metadata_path, metadata
+
+    def evict_dataset(self, dataset):
+        """
+        Forget that generators were used for dataset, e.g. because it was deleted.
+
+        Entries that no other dataset uses are removed.
+
+        Returns:
+        int: Number of entries removed.
+        """
+        removed = 0
+        for weights_path, metadata_path, metadata in self._entries():
+            datasets = metadata.get('datasets', [])
+            if dataset not in datasets:
+                continue
+            metadata['datasets'] = [name for name in datasets if name != dataset]
+            if metadata['datasets']:
+                self._write_metadata(metadata_path, metadata)
+                continue
+            for path in (metadata_path, weights_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        if removed:
+            logging.info(f"Removed {removed} stored generators of {dataset}")
+        return removed
+
+    def rename_dataset(self, old_dataset, new_dataset):
+        """Record entries used for old_dataset under its new name."""
+        for _, metadata_path, metadata in self._entries():
+            datasets = metadata.get('datasets', [])
+            if old_dataset in datasets:
+                metadata['datasets'] = list(dict.fromkeys(
+                    new_dataset if name == old_dataset else name for name in datasets))
+                self._write_metadata(metadata_path, metadata)
+
+
+# Shared by every request handled by this process
+generator_store = GeneratorStore.from_env()
@@ -0,0 +1,85 @@
+# input_pipeline.py
+#
+# tf.data input pipelines shared by the GAN trainers. A pipeline is built once per
+# training run; iterating it once yields one epoch of preprocessed batches, and the next
+# batches are prepared in the background while the current step runs.
+
+import numpy as np
+import tensorflow as tf
+
+# Every record is included in every batch independently with probability
+# batch_size / len(data). This is the sampling the DP-SGD privacy analysis assumes.
+POISSON = 'poisson'
+# Shuffle once per epoch and cut into fixed-size batches (no amplification by sampling)
+SHUFFLE = 'shuffle'
+
+SAMPLING_MODES = (POISSON, SHUFFLE)
+
+
+def steps_per_epoch(number_of_examples, batch_size):
+    return max(int(round(number_of_examples / batch_size)), 1)
+
+
+def poisson_sample_indices(number_of_examples, sampling_rate, rng):
+    """
+    Sorted indices of one Poisson sample of range(number_of_examples).
+
+    Instead of one coin flip per record, the gaps between included records are drawn
+    from a geometric distribution, so a sample costs O(batch size) rather than O(n).
+    """
+    # Expected sample size plus a generous margin; topped up on the rare shortfall
+    chunk = int(number_of_examples * sampling_rate + 6 * np.sqrt(number_of_examples * sampling_rate) + 16)
+    positions = np.cumsum(rng.geometric(sampling_rate, size=chunk)) - 1
+    while positions[-1] < number_of_examples:
+        more = positions[-1] + np.cumsum(rng.geometric(sampling_rate, size=chunk))
+        positions = np.concatenate([positions, more])
+    return positions[:np.searchsorted(positions, number_of_examples)]
+
+
+def build_input_pipeline(data, batch_size, sampling=POISSON, preprocess=None, seed=None):
+    """
+    Build the batched input pipeline for one training run.
+
+    Parameters:
+    data (np.ndarray): Training records along the first axis. Memory-mapped arrays are
+        fine: in Poisson mode only the sampled rows are read from disk.
+    batch_size (int): Batch size, or the expected batch size in Poisson mode.
+    sampling (str): POISSON or SHUFFLE.
+    preprocess (callable, optional): Applied to every batch inside the pipeline, e.g. to
+        cast and normalise; it runs in parallel with the training step.
+    seed (int, optional): Seed for the sampling.
+
+    Returns:
+    tf.data.Dataset: Batches for one epoch per iteration; about len(data) / batch_size
+    batches. Empty Poisson samples are skipped.
+    """
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    number_of_examples = len(data)
+    if number_of_examples == 0:
+        raise ValueError("Cannot train on an empty dataset")
+    batch_size = min(batch_size, number_of_examples)
+
+    if sampling == POISSON:
+        sampling_rate = batch_size / number_of_examples
+        steps = steps_per_epoch(number_of_examples, batch_size)
+        rng = np.random.default_rng(seed)
+
+        def sample_batches():
+            for _ in range(steps):
+                yield data[poisson_sample_indices(number_of_examples, sampling_rate, rng)]
+
+        dataset = tf.data.Dataset.from_generator(
+            sample_batches,
+            output_signature=tf.TensorSpec(shape=(None,) + data.shape[1:], dtype=tf.as_dtype(data.dtype)),
+        )
+        dataset = dataset.filter(lambda batch: tf.shape(batch)[0] > 0)
+    else:
+        # from_tensor_slices loads the records into memory once; they are reused every epoch
+        dataset = tf.data.Dataset.from_tensor_slices(data)
+        dataset = dataset.shuffle(number_of_examples, seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+
+    if preprocess is not None:
+        dataset = dataset.map(preprocess, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -2,12 +2,26 @@
 
 import numpy as np
 from algorithms.dp_algorithm import DPAlgorithm
+from algorithms.rowwise_noise import DEFAULT_CHUNK_SIZE, add_rowwise_noise
 
 class LaplaceMechanism(DPAlgorithm):
-    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip):
+    def __init__(self, row_wise=True, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Row-wise mode noises each record once, in chunks of chunk_size records.
+        # The legacy matrix mode draws a (sample_size, len(data)) noise matrix.
+        self.row_wise = row_wise
+        self.chunk_size = chunk_size
+
+    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip, progress_callback=None):
         # Implementation of synthetic data generation using the Laplace mechanism
         sensitivity = 1  # Sensitivity would depend on the specific data
         scale = sensitivity / epsilon
+
+        if self.row_wise:
+            return add_rowwise_noise(
+                data, sample_size, lambda n: np.random.laplace(0, scale, size=n),
+                lower_clip, upper_clip, chunk_size=self.chunk_size, progress_callback=progress_callback
+            )
+
         synthetic_data = data + np.random.laplace(0, scale, size=(sample_size, len(data)))
         # Apply clipping to the synthetic data
         synthetic_data_clipped = np.clip(synthetic_data, lower_clip, upper_clip)
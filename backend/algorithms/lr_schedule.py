@@ -0,0 +1,83 @@
+# lr_schedule.py
+#
+# Epoch-level learning-rate control shared by the GAN trainers. The rate lives in a
+# tf.Variable (and in the attached Keras optimizers' own rate variables) and is changed
+# in place, so lowering it neither recreates optimizers nor retraces compiled steps.
+
+import tensorflow as tf
+
+
+class LearningRateSchedule:
+    def __init__(self, initial_learning_rate, decay_factor=0.5, decay_every_epochs=None,
+                 plateau_factor=None, plateau_threshold=0.01, plateau_patience=1, min_learning_rate=0.0,
+                 name="learning_rate"):
+        """
+        Parameters:
+        initial_learning_rate (float): Starting learning rate.
+        decay_factor (float): Multiplier applied every decay_every_epochs epochs.
+        decay_every_epochs (int, optional): Step-decay period; None disables step decay.
+        plateau_factor (float, optional): Multiplier applied when the loss stops improving;
+            None disables plateau reduction.
+        plateau_threshold (float): Relative improvement over the best loss so far that
+            counts as progress.
+        plateau_patience (int): Epochs without progress before the rate is reduced.
+        min_learning_rate (float): Lower bound for the rate.
+        """
+        self.decay_factor = decay_factor
+        self.decay_every_epochs = decay_every_epochs
+        self.plateau_factor = plateau_factor
+        self.plateau_threshold = plateau_threshold
+        self.plateau_patience = plateau_patience
+        self.min_learning_rate = min_learning_rate
+        self.variable = tf.Variable(float(initial_learning_rate), trainable=False, dtype=tf.float32, name=name)
+        self._optimizers = []
+        self._best_loss = float('inf')
+        self._epochs_without_progress = 0
+
+    @property
+    def value(self):
+        return float(self.variable.numpy())
+
+    def attach(self, optimizer):
+        """
+        Keep a Keras optimizer's learning rate in sync with this schedule.
+
+        Keras optimizers copy a rate passed to their constructor into a variable of their
+        own; assigning through the learning_rate property updates that variable in place.
+        Optimizers that read the rate as a tensor (the tf.compat.v1 DP optimizers) can be
+        given self.variable directly instead.
+        """
+        optimizer.learning_rate = self.value
+        self._optimizers.append(optimizer)
+        return optimizer
+
+    def set(self, learning_rate):
+        learning_rate = max(float(learning_rate), self.min_learning_rate)
+        self.variable.assign(learning_rate)
+        for optimizer in self._optimizers:
+            optimizer.learning_rate = learning_rate
+
+    def scale(self, factor):
+        self.set(self.value * factor)
+
+    def on_epoch_begin(self, epoch):
+        """Apply step decay before epoch (0-based). Returns True if the rate changed."""
+        if self.decay_every_epochs and (epoch + 1) % self.decay_every_epochs == 0:
+            self.scale(self.decay_factor)
+            return True
+        return False
+
+    def on_epoch_end(self, loss):
+        """Record the epoch's average loss and reduce the rate on a plateau. Returns True if the rate changed."""
+        improved = loss <= self._best_loss * (1 - self.plateau_threshold)
+        self._best_loss = min(self._best_loss, loss)
+        if improved:
+            self._epochs_without_progress = 0
+            return False
+
+        self._epochs_without_progress += 1
+        if self.plateau_factor is None or self._epochs_without_progress < self.plateau_patience:
+            return False
+        self._epochs_without_progress = 0
+        self.scale(self.plateau_factor)
+        return True
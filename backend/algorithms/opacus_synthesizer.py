@@ -0,0 +1,81 @@
+# opacus_synthesizer.py
+
+import math
+
+import numpy as np
+
+from algorithms.dp_algorithm import DPAlgorithm, InvalidParametersError
+import data_synthesizer
+
+
+class OpacusSynthesizer(DPAlgorithm):
+    # Largest output domain derived from the clipping bounds; the classifier has one
+    # output per category. Domains listed in a request are not limited.
+    MAX_CATEGORIES = 10_000
+
+    def __init__(self, epochs=5, noise_dim=data_synthesizer.DEFAULT_NOISE_DIM):
+        self.epochs = epochs
+        self.noise_dim = noise_dim
+
+    @classmethod
+    def category_domain(cls, lower_clip, upper_clip):
+        """
+        Categories the synthesizer may output: every integer between the clipping bounds.
+
+        The domain is public, so the output does not reveal which values occur in the data.
+
+        Raises:
+        InvalidParametersError: If the bounds are not finite or span more than MAX_CATEGORIES integers.
+        """
+        if not (math.isfinite(lower_clip) and math.isfinite(upper_clip)):
+            raise InvalidParametersError("Clipping bounds must be finite")
+        lower, upper = math.ceil(lower_clip), math.floor(upper_clip)
+        if upper < lower:
+            raise InvalidParametersError("No integer values between the clipping bounds")
+        if upper - lower + 1 > cls.MAX_CATEGORIES:
+            raise InvalidParametersError(
+                f"The clipping bounds span {upper - lower + 1} integers; at most {cls.MAX_CATEGORIES} are supported")
+        return np.arange(lower, upper + 1, dtype=np.int64)
+
+    @staticmethod
+    def clipped_integer_values(data, categories):
+        """
+        The column clipped to the category domain, as int64 and without missing values.
+
+        Without a listed category domain, only integer-valued columns are supported: the
+        output domain has to be public, and the distinct values of any other column would
+        release record values verbatim.
+
+        Raises:
+        InvalidParametersError: For columns with non-integer values.
+        """
+        if np.issubdtype(data.dtype, np.integer):
+            return np.clip(data, categories[0], categories[-1]).astype(np.int64)
+        if np.issubdtype(data.dtype, np.floating):
+            # Integer columns with missing values are float64 in pandas
+            data = data[~np.isnan(data)]
+            if np.all(data == np.round(data)):
+                return np.clip(data, categories[0], categories[-1]).astype(np.int64)
+        raise InvalidParametersError(
+            "Without a categories list, the Opacus Synthesizer only supports integer-valued columns")
+
+    def generate_synthetic_data(self, data, sample_size, epsilon, delta, lower_clip, upper_clip, progress_callback=None,
+                                categories=None):
+        # categories, if given, is the public list of values the column may take (strings,
+        # numbers, any number of them); values outside it are dropped. Without it, the
+        # domain is every integer between the clipping bounds.
+        data = np.asarray(data).ravel()
+        if categories is not None:
+            categories = np.asarray(list(dict.fromkeys(categories)))
+        else:
+            categories = self.category_domain(lower_clip, upper_clip)
+            data = self.clipped_integer_values(data, categories)
+
+        codes, categories = data_synthesizer.encode_column(data, categories)
+        if len(codes) == 0:
+            raise InvalidParametersError("No values of the column are in the category domain")
+        model = data_synthesizer.train_private_model(
+            codes, len(categories), epsilon, delta, self.epochs,
+            noise_dim=self.noise_dim, progress_callback=progress_callback
+        )
+        return data_synthesizer.generate_synthetic_data(model, sample_size, categories, noise_dim=self.noise_dim)
@@ -0,0 +1,88 @@
+# private_targets.py
+#
+# Differentially private summary statistics of a bounded numeric column. DPGAN uses
+# them as fixed targets for its auxiliary mean/median/min/max losses.
+
+import numpy as np
+
+# Candidate outputs considered by the exponential mechanism
+DEFAULT_GRID_SIZE = 1001
+# Quantiles standing in for the minimum and maximum. The exact extremes are not
+# identifiable under DP: every point below the minimum is an equally good "minimum".
+MIN_QUANTILE = 0.01
+MAX_QUANTILE = 0.99
+
+
+def laplace_mean(values, epsilon, lower, upper, rng=None):
+    """
+    epsilon-DP mean of values clamped to [lower, upper] (Laplace mechanism).
+
+    Parameters:
+    values (np.ndarray): 1-D array of values, already clamped to [lower, upper].
+    epsilon (float): Privacy budget spent on this statistic.
+    lower, upper (float): Bounds of the data domain.
+
+    Returns:
+    float: The noisy mean, clamped to [lower, upper].
+    """
+    rng = rng or np.random.default_rng()
+    sensitivity = (upper - lower) / len(values)
+    noisy_mean = float(np.mean(values)) + rng.laplace(0, sensitivity / epsilon)
+    return float(np.clip(noisy_mean, lower, upper))
+
+
+def exponential_quantile(sorted_values, quantile, epsilon, lower, upper, grid_size=DEFAULT_GRID_SIZE, rng=None):
+    """
+    epsilon-DP quantile of sorted values using the exponential mechanism.
+
+    Candidates are grid_size evenly spaced points of [lower, upper]. A candidate c scores
+    -max(#{x < c} - q*n, q*n - #{x <= c}), which is 0 exactly when c is a q-quantile of
+    the data (ties included) and changes by at most 1 when one record changes. A candidate
+    is picked with probability proportional to exp(epsilon * score / 2).
+
+    Parameters:
+    sorted_values (np.ndarray): 1-D array sorted ascending and clamped to [lower, upper].
+    quantile (float): Quantile in [0, 1]; 0.5 is the median.
+    epsilon (float): Privacy budget spent on this statistic.
+    lower, upper (float): Bounds of the data domain.
+    grid_size (int): Number of candidate outputs.
+
+    Returns:
+    float: The private quantile estimate.
+    """
+    rng = rng or np.random.default_rng()
+    target_rank = quantile * len(sorted_values)
+    candidates = np.linspace(lower, upper, grid_size)
+    below = np.searchsorted(sorted_values, candidates, side='left')
+    at_or_below = np.searchsorted(sorted_values, candidates, side='right')
+    score = -np.maximum(below - target_rank, target_rank - at_or_below)
+    # Gumbel-max trick: argmax(log weight + Gumbel noise) samples from the softmax
+    index = int(np.argmax(epsilon * score / 2 + rng.gumbel(size=grid_size)))
+    return float(candidates[index])
+
+
+def private_targets(values, epsilon, lower, upper, rng=None):
+    """
+    Private mean, median, min and max of a column, splitting epsilon evenly between them.
+
+    Values are clamped to [lower, upper] first, which bounds the sensitivity of every
+    statistic. The min and max are the MIN_QUANTILE and MAX_QUANTILE quantiles.
+
+    Returns:
+    dict: 'mean', 'median', 'min' and 'max' as floats.
+    """
+    if epsilon <= 0:
+        raise ValueError("epsilon must be positive")
+    values = np.clip(np.asarray(values, dtype=np.float64).ravel(), lower, upper)
+    if len(values) == 0:
+        raise ValueError("Cannot compute statistics of an empty column")
+    rng = rng or np.random.default_rng()
+    epsilon_each = epsilon / 4
+
+    sorted_values = np.sort(values)
+    return {
+        "mean": laplace_mean(values, epsilon_each, lower, upper, rng=rng),
+        "median": exponential_quantile(sorted_values, 0.5, epsilon_each, lower, upper, rng=rng),
+        "min": exponential_quantile(sorted_values, MIN_QUANTILE, epsilon_each, lower, upper, rng=rng),
+        "max": exponential_quantile(sorted_values, MAX_QUANTILE, epsilon_each, lower, upper, rng=rng),
+    }
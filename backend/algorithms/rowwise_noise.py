@@ -0,0 +1,47 @@
+# rowwise_noise.py
+
+import numpy as np
+
+# Number of records noised per chunk; bounds the temporary buffers to a few MB
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+def add_rowwise_noise(data, sample_size, noise_sampler, lower_clip, upper_clip, chunk_size=DEFAULT_CHUNK_SIZE,
+                      progress_callback=None):
+    """
+    Produce exactly one noised, clipped and rounded value per output record.
+
+    Parameters:
+    data (array-like): 1-D column of original values.
+    sample_size (int): Number of output records. Record i is taken from data[i % len(data)],
+        so sample_size == len(data) gives one noised value per original record.
+    noise_sampler (callable): Called as noise_sampler(n) and returns n noise draws.
+    lower_clip, upper_clip (float): Clipping bounds applied after the noise.
+    chunk_size (int): Number of records processed at a time.
+    progress_callback (callable, optional): Called as progress_callback(done, sample_size) after each chunk.
+
+    Returns:
+    np.ndarray: Float array of shape (sample_size,).
+    """
+    data = np.asarray(data, dtype=np.float64).ravel()
+    if len(data) == 0:
+        raise ValueError("Cannot generate synthetic data from an empty column")
+
+    output = np.empty(sample_size, dtype=np.float64)
+    for start in range(0, sample_size, chunk_size):
+        stop = min(start + chunk_size, sample_size)
+        if sample_size == len(data):
+            chunk = data[start:stop]
+        else:
+            chunk = data[np.arange(start, stop) % len(data)]
+
+        # Noise, clip and round in place inside the output buffer
+        out = output[start:stop]
+        np.add(chunk, noise_sampler(stop - start), out=out)
+        np.clip(out, lower_clip, upper_clip, out=out)
+        np.rint(out, out=out)
+
+        if progress_callback is not None:
+            progress_callback(stop, sample_size)
+
+    return output
@@ -1,67 +1,67 @@
-import uuid
 from flask import Flask, request, jsonify, send_file, session
-import subprocess
-import json
 import pandas as pd
 import numpy as np
-from opacus import PrivacyEngine
-import tensorflow as tf
-import io
 import logging
-from data_synthesizer import generate_private_data
 from flask_cors import CORS
 import os
-import time
-from algorithm_registry import AlgorithmRegistry
-from algorithms.gaussian_mechanism import GaussianMechanism
-from algorithms.dp_gan import DPGAN
-from algorithms.dp_gan_images import DPGANImages
-from algorithms.laplace_mechanism import LaplaceMechanism
-from PIL import Image
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-import torch
-import base64
+from algorithm_registry import AlgorithmRegistry, register_default_algorithms
+from algorithms.dp_algorithm import InvalidParametersError
+from algorithms.generator_store import generator_store
 from flask_socketio import SocketIO, emit
 from time import sleep
-from google.oauth2 import service_account
-from googleapiclient import discovery
+from chatbot import ChatbotService, ChatbotDisabledError
+from jobs import JobManager
+from tasks import (InvalidRequestError, check_multi_column_request, check_tabular_request,
+                   generate_multi_column_data, generate_tabular_data,
+                   generate_image_data as run_image_generation)
+from budget_ledger import InsufficientBudgetError, budget_ledger
+from dataset_cache import dataset_cache
+from dp_statistics import answer_queries, determine_batch_epsilons, determine_epsilon, noisy_column_statistic
+from image_preview import make_sprite, preview_etag, raw_buffer, thumbnail_cache
+import aggregate_index
+import columnar
+from schema import load_schema, write_schema
+from sidecar import remove_sidecars, rename_sidecars
+
+# TensorFlow, PyTorch, Opacus, transformers and the Google API client are imported by the
+# code paths that need them, so the CSV and statistics endpoints start without them.
+# Run benchmarks/startup_time.py to check the cold-start budget.
 
 ### DP ALGORITHM REGISTRY ###
-# Register the algorithms
-AlgorithmRegistry.register_algorithm("Gaussian Mechanism", GaussianMechanism)
-AlgorithmRegistry.register_algorithm("DP-GAN", DPGAN)
-AlgorithmRegistry.register_algorithm("DP-GAN Images", DPGANImages)
-AlgorithmRegistry.register_algorithm("Laplace Mechanism", LaplaceMechanism)
+# Register the algorithms (resolved and instantiated on first use)
+register_default_algorithms()
 
 ### BACKEND SERVER ###
 app = Flask(__name__)
 app.secret_key = os.urandom(16)  # or a hard-coded secret key
 
 # Enable CORS for all routes if necessary
-CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+# Response headers the frontend is allowed to read (pagination of the preview endpoints
+# and the grid/shape headers of the sprite and raw image formats)
+EXPOSED_HEADERS = [
+    'X-Total-Count', 'X-Offset', 'ETag',
+    'X-Grid-Count', 'X-Grid-Rows', 'X-Grid-Columns', 'X-Tile-Height', 'X-Tile-Width',
+    'X-Array-Shape', 'X-Array-Dtype',
+]
+CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}}, expose_headers=EXPOSED_HEADERS)
 
 # Initialize SocketIO with CORS enabled
 socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000")
 
 logging.basicConfig(level=logging.INFO)
 
-### CHATBOT ###
-model_name = "dzagardo/tiny-llama-orca-amp-gclip-dp-pa-sgd-dz-v1.1.1000"
-model = AutoModelForCausalLM.from_pretrained(model_name)
-
-# Load tokenizer (assuming you are using the same tokenizer)
-tokenizer = AutoTokenizer.from_pretrained(model_name)
+### BACKGROUND JOBS ###
+# Long-running generation requests submitted with "async": true run in a process pool of
+# JOB_CONCURRENCY workers; every status/progress change is pushed as a 'job_progress' event.
+job_manager = JobManager.from_env(on_update=lambda job: socketio.emit('job_progress', job))
 
-# Set device to GPU if available
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-# Initialize pipeline with your model
-pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, device=device)
+### CHATBOT ###
+# The model is loaded on first use (or via /chat/warmup) and unloaded when idle.
+# Configure with CHATBOT_ENABLED, CHATBOT_IDLE_TIMEOUT, CHATBOT_MODEL_NAME and CHATBOT_WARMUP.
+chatbot = ChatbotService.from_env()
 
-# model = AutoModelForCausalLM.from_pretrained("./path_to_saved_model")
-# tokenizer = AutoTokenizer.from_pretrained("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
-# device = "cuda" if torch.cuda.is_available() else "cpu"
-# pipe = pipeline("text-generation", model="TinyLlama/TinyLlama-1.1B-Chat-v1.0", device=device)
+if os.environ.get("CHATBOT_WARMUP", "0").lower() in ("1", "true", "yes"):
+    chatbot.warm_up()
 
 @app.route('/')
 def home():
@@ -83,8 +83,8 @@ def write_csv(data, file_path):
 @app.route('/list_files', methods=['GET'])
 def list_files():
     try:
-        # List files in the 'data' directory
-        files = os.listdir('data')
+        # List files in the 'data' directory, including outputs only stored in columnar form
+        files = columnar.list_datasets('data')
         # Return the list of files
         return jsonify(files), 200
     except Exception as e:
@@ -95,42 +95,107 @@ def list_files():
 def get_file(filename):
     file_path = os.path.join('data', filename)
     try:
-        if os.path.isfile(file_path):
-            return send_file(file_path)
+        if columnar.dataset_exists(file_path):
+            # Synthetic outputs are stored in columnar form; the CSV is produced on download
+            return send_file(columnar.materialize_csv(file_path))
         else:
             return jsonify({"error": "File not found"}), 404
     except Exception as e:
         logging.error(f"An error occurred while retrieving the file: {e}")
         return jsonify({"error": str(e)}), 500
 
-# Function to convert image to base64
-def image_to_base64(image: np.ndarray) -> str:
-    pil_image = Image.fromarray(image)
-    buffered = io.BytesIO()
-    pil_image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return img_str
+DEFAULT_PREVIEW_LIMIT = 50
+MAX_PREVIEW_LIMIT = 1000
 
-@app.route('/get_train_images/<filename>', methods=['GET'])
-def get_train_images(filename):
+def get_pagination_args():
+    """Read the offset/limit query parameters used by the preview endpoints."""
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', DEFAULT_PREVIEW_LIMIT, type=int)
+    return offset, min(max(limit, 0), MAX_PREVIEW_LIMIT)
+
+def load_npy_slice(file_path, offset, limit):
+    """
+    Read rows [offset, offset + limit) of a .npy file without loading the rest.
+
+    Returns:
+    tuple: (np.ndarray slice, total number of rows in the file)
+    """
+    # The memory map only pages in the bytes of the requested rows
+    array = np.load(file_path, mmap_mode='r')
+    return np.array(array[offset:offset + limit]), len(array)
+
+def paginated_response(items, offset, total):
+    response = jsonify(items)
+    response.headers['X-Total-Count'] = str(total)
+    response.headers['X-Offset'] = str(offset)
+    return response
+
+PREVIEW_FORMATS = ('json', 'sprite', 'raw')
+
+def image_preview_response(filename):
+    """
+    Previews of a page of a .npy image file, with ETag revalidation.
+
+    The 'format' query parameter selects the payload:
+    json   - JSON array of base64 PNG strings (default)
+    sprite - one PNG sprite sheet; the grid layout is in the X-Grid-* / X-Tile-* headers
+             ('columns' sets the tiles per row)
+    raw    - the pixel buffer as application/octet-stream, described by X-Array-Shape
+             and X-Array-Dtype
+    """
     file_path = os.path.join('data', filename)
     try:
-        if os.path.exists(file_path):
-            images = np.load(file_path)[:50]  # Modify this line
-            images_base64 = [image_to_base64(img) for img in images]
-            return jsonify(images_base64)
-        else:
+        if not os.path.exists(file_path):
             return jsonify({"error": "File not found"}), 404
+
+        preview_format = request.args.get('format', 'json')
+        if preview_format not in PREVIEW_FORMATS:
+            return jsonify({"error": f"Unknown format {preview_format}, expected one of {', '.join(PREVIEW_FORMATS)}"}), 400
+        columns = request.args.get('columns', type=int)
+
+        offset, limit = get_pagination_args()
+        etag = preview_etag(file_path, offset, limit, preview_format, columns)
+        if request.if_none_match.contains(etag):
+            # The browser already holds this page
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        images, total = load_npy_slice(file_path, offset, limit)
+        if preview_format == 'sprite':
+            sprite, grid = make_sprite(images, columns=columns)
+            response = app.response_class(sprite, mimetype='image/png')
+            response.headers['X-Grid-Count'] = str(grid['count'])
+            response.headers['X-Grid-Rows'] = str(grid['rows'])
+            response.headers['X-Grid-Columns'] = str(grid['columns'])
+            response.headers['X-Tile-Height'] = str(grid['tile_height'])
+            response.headers['X-Tile-Width'] = str(grid['tile_width'])
+        elif preview_format == 'raw':
+            buffer, shape, dtype = raw_buffer(images)
+            response = app.response_class(buffer, mimetype='application/octet-stream')
+            response.headers['X-Array-Shape'] = ','.join(str(dim) for dim in shape)
+            response.headers['X-Array-Dtype'] = dtype
+        else:
+            response = jsonify(thumbnail_cache.encode_batch(images))
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Offset'] = str(offset)
+        response.set_etag(etag)
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/get_train_images/<filename>', methods=['GET'])
+def get_train_images(filename):
+    return image_preview_response(filename)
+
 @app.route('/get_train_labels/<filename>', methods=['GET'])
 def get_train_labels(filename):
     file_path = os.path.join('data', filename)
     try:
         if os.path.exists(file_path):
-            labels = np.load(file_path)[:50]  # Modify this line
-            return jsonify(labels.tolist())
+            offset, limit = get_pagination_args()
+            labels, total = load_npy_slice(file_path, offset, limit)
+            return paginated_response(labels.tolist(), offset, total)
         else:
             return jsonify({"error": "File not found"}), 404
     except Exception as e:
@@ -138,24 +203,16 @@ def get_train_labels(filename):
 
 @app.route('/get_test_images/<filename>', methods=['GET'])
 def get_test_images(filename):
-    file_path = os.path.join('data', filename)
-    try:
-        if os.path.exists(file_path):
-            images = np.load(file_path)[:50]  # Modify this line
-            images_base64 = [image_to_base64(img) for img in images]
-            return jsonify(images_base64)
-        else:
-            return jsonify({"error": "File not found"}), 404
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return image_preview_response(filename)
 
 @app.route('/get_test_labels/<filename>', methods=['GET'])
 def get_test_labels(filename):
     file_path = os.path.join('data', filename)
     try:
         if os.path.exists(file_path):
-            labels = np.load(file_path)[:50]  # Modify this line
-            return jsonify(labels.tolist())
+            offset, limit = get_pagination_args()
+            labels, total = load_npy_slice(file_path, offset, limit)
+            return paginated_response(labels.tolist(), offset, total)
         else:
             return jsonify({"error": "File not found"}), 404
     except Exception as e:
@@ -166,9 +223,10 @@ def get_column_names(filename):
     try:
         file_path = os.path.join('./data/', filename)
 
-        if os.path.isfile(file_path):
-            data = pd.read_csv(file_path)
-            column_names = data.columns.tolist()  # Extract column names
+        if columnar.dataset_exists(file_path):
+            # Served from the sidecar schema; only the header and a small sample are ever parsed
+            schema = load_schema(file_path)
+            column_names = [column['name'] for column in schema['columns']]
             return jsonify(column_names), 200
         else:
             print("File not found:", file_path)
@@ -181,9 +239,9 @@ def get_column_names(filename):
 def get_ratings(filename):
     file_path = os.path.join('data', filename)
     try:
-        if os.path.isfile(file_path):
-            data = pd.read_csv(file_path)
+        if columnar.dataset_exists(file_path):
             # Assuming 'rating' is the column name for ratings in your CSV file
+            data = dataset_cache.get(file_path, columns=['rating'])
             ratings = data['rating'].tolist()
             return jsonify(ratings), 200
         else:
@@ -223,6 +281,25 @@ def upload_csv():
         file.save(file_save_path)
         logging.info(f"File {file.filename} saved as {file_save_path}")
 
+        # Start the dataset's privacy budget at the value chosen on upload, if any
+        privacy_budget = request.form.get('privacyBudget')
+        if privacy_budget is not None and validate_budget(privacy_budget):
+            update_budget_in_db(unique_filename, privacy_budget)
+
+        # Record the schema sidecar used by the column picker
+        if ext.lower() == '.csv':
+            try:
+                write_schema(file_save_path)
+            except Exception as e:
+                logging.warning(f"Could not sniff the schema of {file_save_path}: {e}")
+            # Convert once to columnar storage so later reads only touch the columns they need
+            try:
+                columnar.ingest(file_save_path)
+            except Exception as e:
+                logging.warning(f"Could not convert {file_save_path} to columnar storage: {e}")
+            # Summarize the columns for /get_noisy without holding up the response
+            aggregate_index.build_in_background(file_save_path)
+
         # Flask backend pseudo-code
         return jsonify({
             "message": "File uploaded successfully",
@@ -234,6 +311,18 @@ def upload_csv():
         logging.error(f"An error occurred while processing the file: {str(e)}")
         return str(e), 500
     
+def wants_async(data):
+    """True if the client asked for the work to run as a background job."""
+    return bool(data.get('async')) or request.args.get('async', '').lower() in ('1', 'true')
+
+def job_accepted_response(job):
+    return jsonify({
+        "message": "Job submitted",
+        "job_id": job['id'],
+        "status": job['status'],
+        "status_url": f"/jobs/{job['id']}"
+    }), 202
+
 @app.route('/generate_data/<algorithm_name>/<filename>', methods=['POST'])
 def generate_data(algorithm_name, filename):
     try:
@@ -242,66 +331,64 @@ def generate_data(algorithm_name, filename):
         # Parse epsilon, delta, clipping values, and column name from the request data
         data = request.get_json()
         print("data is: ", data)
-        epsilon = data.get('epsilon', 1.0)
-        delta = data.get('delta', 1e-5)
-        lower_clip = data.get('lowerClip', 0)
-        upper_clip = data.get('upperClip', 5)
-        column_name = data.get('column_name')  # This is the new parameter for the column name
-
-        # Sanitize epsilon and delta by replacing dots with underscores
-        epsilon_str = str(epsilon).replace('.', '_')
-        delta_str = str(delta).replace('.', '_')
-        
-        if not column_name:
-            return jsonify({"error": "Column name not provided"}), 400
-
-        uploaded_file_path = os.path.join('data', filename)
-        if not os.path.exists(uploaded_file_path):
-            logging.error(f"File does not exist: {filename}")
-            return "File does not exist", 400
 
-        logging.info(f"File found: {filename}")
-        original_data = pd.read_csv(uploaded_file_path)
-        sample_size = len(original_data)
-
-        dp_algorithm = AlgorithmRegistry.get_algorithm(algorithm_name)
-        if not dp_algorithm:
-            logging.error(f"Algorithm not found in registry: {algorithm_name}")
-            raise ValueError(f"Algorithm {algorithm_name} not found in registry")
-
-        logging.info(f"Algorithm retrieved: {algorithm_name}")
-
-        # Make sure the column exists in the data
-        if column_name not in original_data.columns:
-            return jsonify({"error": f"Column {column_name} not found in data"}), 400
-
-        logging.info("Generating synthetic data...")
-        synthetic_data = dp_algorithm.generate_synthetic_data(
-            original_data[column_name].values,
-            sample_size,
-            epsilon,
-            delta,
-            lower_clip,
-            upper_clip
+        # Multi-column mode: 'columns' lists the columns, each with optional 'algorithm',
+        # 'epsilon', 'lowerClip' and 'upperClip'; one output file holds all of them
+        if data.get('columns') is not None:
+            params = dict(
+                algorithm_name=algorithm_name,
+                filename=filename,
+                columns=data['columns'],
+                epsilon=data.get('epsilon', 1.0),
+                delta=data.get('delta', 1e-5),
+            )
+            try:
+                check_multi_column_request(algorithm_name, filename, params['columns'],
+                                           params['epsilon'], params['delta'])
+            except InvalidRequestError as e:
+                return jsonify({"error": str(e)}), 400
+
+            if wants_async(data):
+                return job_accepted_response(job_manager.submit('generate_data', generate_multi_column_data, **params))
+
+            try:
+                result = generate_multi_column_data(**params)
+            except InvalidParametersError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({
+                "message": "Data with synthetic values generated successfully.",
+                **result
+            }), 200
+
+        params = dict(
+            algorithm_name=algorithm_name,
+            filename=filename,
+            column_name=data.get('column_name'),  # This is the new parameter for the column name
+            epsilon=data.get('epsilon', 1.0),
+            delta=data.get('delta', 1e-5),
+            lower_clip=data.get('lowerClip', 0),
+            upper_clip=data.get('upperClip', 5),
+            # Public list of the column's values, for algorithms with a categorical output domain
+            categories=data.get('categories'),
         )
 
-        print("synthetic data is: ", synthetic_data)
-
-        logging.info("Synthetic data generation complete.")
-
-        # Update the filename to include the algorithm name and clipping values
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        modified_file_name = f"{algorithm_name}_eps{epsilon_str}_delta{delta_str}_lower{lower_clip}_upper{upper_clip}_data_{timestamp}.csv"
-        modified_file_path = os.path.join('data', modified_file_name)
+        try:
+            check_tabular_request(algorithm_name, filename, params['column_name'],
+                                  params['lower_clip'], params['upper_clip'], params['categories'])
+        except InvalidRequestError as e:
+            return jsonify({"error": str(e)}), 400
 
-        original_data[column_name] = synthetic_data
-        original_data.to_csv(modified_file_path, index=False)
-        logging.info(f"Modified data written to {modified_file_path}")
+        if wants_async(data):
+            return job_accepted_response(job_manager.submit('generate_data', generate_tabular_data, **params))
 
+        try:
+            result = generate_tabular_data(**params)
+        except InvalidParametersError as e:
+            # The algorithm rejected the data or settings, e.g. an output domain too large
+            return jsonify({"error": str(e)}), 400
         return jsonify({
             "message": "Data with synthetic values generated successfully.",
-            "file_path": modified_file_path,
-            "file_name": modified_file_name
+            **result
         }), 200
 
     except Exception as e:
@@ -315,10 +402,6 @@ def generate_image_data(algorithm_name):
 
         # Parse request data
         data = request.get_json()
-        epsilon = data.get('epsilon', 1.0)
-        delta = data.get('delta', 1e-5)
-        lower_clip = data.get('lowerClip', 0)
-        upper_clip = data.get('upperClip', 5)
         train_images_file = data.get('trainImages')
         train_labels_file = data.get('trainLabels')
         test_images_file = data.get('testImages')
@@ -329,34 +412,27 @@ def generate_image_data(algorithm_name):
             logging.error("One or more file paths are missing")
             return jsonify({"error": "One or more file paths are missing"}), 400
 
-        dp_algorithm = AlgorithmRegistry.get_algorithm(algorithm_name)
-        if not dp_algorithm:
+        if algorithm_name not in AlgorithmRegistry.registered_names():
             logging.error(f"Algorithm not found in registry: {algorithm_name}")
-            raise ValueError(f"Algorithm {algorithm_name} not found in registry")
-
-        logging.info(f"Algorithm retrieved: {algorithm_name}")
-
-        # Assuming these are file paths, you need to load the data from these files
-        # Here's a simplified example, your actual loading will depend on your file format
-        train_images = load_images(train_images_file)
-        train_labels = load_labels(train_labels_file)
-        test_images = load_images(test_images_file)
-        test_labels = load_labels(test_labels_file)
-
-        # Assume you have the same number of images and labels
-        sample_size = len(train_images)
-
-        # Load only train images and labels
-        train_images = load_images(train_images_file)
-        train_labels = load_labels(train_labels_file)
-
-        # Generate synthetic data
-        synthetic_train_images, synthetic_train_labels = dp_algorithm.generate_synthetic_data(
-            train_images, train_labels, 100, epsilon, delta, lower_clip, upper_clip
+            return jsonify({"error": f"Algorithm {algorithm_name} not registered"}), 400
+
+        params = dict(
+            algorithm_name=algorithm_name,
+            train_images_file=train_images_file,
+            train_labels_file=train_labels_file,
+            epsilon=data.get('epsilon', 1.0),
+            delta=data.get('delta', 1e-5),
+            lower_clip=data.get('lowerClip', 0),
+            upper_clip=data.get('upperClip', 5),
+            sample_size=data.get('sampleSize', 100),
+            # Public list of label classes; the algorithm's default domain when omitted
+            classes=data.get('classes'),
         )
 
-        # Save only train images and labels
-        save_paths = save_synthetic_data(synthetic_train_images, synthetic_train_labels)
+        if wants_async(data):
+            return job_accepted_response(job_manager.submit('generate_image_data', run_image_generation, **params))
+
+        save_paths = run_image_generation(**params)
 
         # Prepare response with only train data paths
         response_data = {
@@ -370,118 +446,62 @@ def generate_image_data(algorithm_name):
         logging.error(f"An error occurred: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def save_synthetic_data(synthetic_train_images, synthetic_train_labels):
-    # Define the directories for saving the data
-    train_images_dir = 'data/train_images'
-    train_labels_dir = 'data/train_labels.csv'
-
-    # Create the directories if they don't exist
-    os.makedirs(train_images_dir, exist_ok=True)
-
-    # Save train images and labels
-    train_labels_list = []
-    for index, (image, label) in enumerate(zip(synthetic_train_images, synthetic_train_labels)):
-        try:
-            # Reshape image if it's grayscale
-            if image.shape[-1] == 1:
-                image = image.reshape(image.shape[0], image.shape[1])
-
-            # Convert to PIL image and save
-            img = Image.fromarray(image.astype(np.uint8))
-            img.save(os.path.join(train_images_dir, f'train_image_{index}.png'))
-            train_labels_list.append({'id': index, 'label': label})
-        except Exception as e:
-            print(f"Error saving image {index}: {e}")
-    
-    # Save train labels to CSV
-    pd.DataFrame(train_labels_list).to_csv(train_labels_dir, index=False)
-
-    # Return only the paths for train images and labels
-    return {
-        'train_images_dir': train_images_dir,
-        'train_labels_file': train_labels_dir
-    }
-
-def load_images(file_path):
-    """
-    Load images from a .npy file.
-
-    Parameters:
-    file_path (str): The path to the .npy file containing the images.
-
-    Returns:
-    np.array: An array of images loaded from the .npy file.
-    """
-
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"The file {file_path} does not exist.")
-
-    # Load the images from the .npy file
-    images = np.load(file_path)
-
-    return images
-
-def load_labels(file_path):
-    """
-    Load labels from a .npy file.
-
-    Parameters:
-    file_path (str): Path to the .npy file containing labels.
-
-    Returns:
-    numpy.ndarray: Array of labels.
-    """
-    try:
-        labels = np.load(file_path)
-        return labels
-    except Exception as e:
-        logging.error(f"Failed to load labels from {file_path}: {e}")
-        raise
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(job_manager.list()), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
 
 @app.route('/api/datasets/mean_rating/<dataset_id>/<algorithm_name>', methods=['GET'])
 def get_noisy_mean_rating(dataset_id, algorithm_name):
-    try:        
-        # Parse epsilon, delta, clipping values, and column name from the request data
-        data = request.get_json()
-        epsilon = data.get('epsilon', 1.0)
-        delta = data.get('delta', 1e-5)
-        column_name = data.get('column_name')  # This is the new parameter for the column name
-        # Retrieve the rating column
-
-        # Retrieve current epsilon (privacy budget) for the dataset
-        current_epsilon = get_current_epsilon(dataset_id)
-
-        # Define the sensitivity and delta of your query
-        sensitivity = 1  # Set based on your specific dataset and query
-        delta = 1e-5  # Set based on your requirements
-
-        # Get the DP algorithm instance from the registry
-        dp_algorithm = AlgorithmRegistry.get_algorithm(algorithm_name)
-
-        # Calculate the noisy mean
-        noisy_mean = dp_algorithm.generate_noisy_mean(
-            data=data[column_name].values,
-            epsilon=epsilon,
-            delta=delta
-        )
+    try:
+        # Parse epsilon and column name from the request data
+        data = request.get_json(silent=True) or request.args
+        epsilon = float(data.get('epsilon', 1.0))
+        column_name = data.get('column_name', 'rating')  # This is the new parameter for the column name
+
+        if os.path.basename(dataset_id) != dataset_id:
+            return jsonify({"error": "Invalid dataset"}), 400
+        if algorithm_name not in AlgorithmRegistry.registered_names():
+            return jsonify({"error": f"Algorithm {algorithm_name} not registered"}), 400
 
-        # Deduct the used epsilon from the dataset's privacy budget
-        deduct_epsilon(dataset_id, current_epsilon)
+        # Calculate the noisy mean of the rating column. The registered algorithms synthesize
+        # whole columns, so the mean itself is released with the Laplace mechanism.
+        noisy_mean = noisy_column_statistic(os.path.join('data', dataset_id), column_name, epsilon, 'mean')
 
-        return jsonify(mean_rating=noisy_mean), 200
+        # Deduct the used epsilon from the dataset's privacy budget before releasing the result
+        remaining_budget = deduct_epsilon(dataset_id, epsilon, reason=f"mean_rating {column_name}")
+
+        return jsonify(mean_rating=float(noisy_mean), remainingPrivacyBudget=remaining_budget), 200
+    except InsufficientBudgetError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return str(e), 500
 
 def get_current_epsilon(dataset_id):
-    # Retrieve the current privacy budget for the dataset from the database
-    dataset = getDataset(dataset_id)
-    return dataset.privacy_budget
+    # Retrieve the current privacy budget for the dataset from the ledger
+    return budget_ledger.remaining(dataset_id)
+
+def deduct_epsilon(dataset_id, used_epsilon, reason=None):
+    # Atomically deduct the used epsilon from the dataset's privacy budget.
+    # Raises InsufficientBudgetError, without deducting anything, if too little is left.
+    return budget_ledger.deduct(dataset_id, used_epsilon, reason=reason)
 
-def deduct_epsilon(dataset_id, used_epsilon):
-    # Deduct the used epsilon from the dataset's privacy budget and update the database
-    dataset = getDataset(dataset_id)
-    new_epsilon = max(dataset.privacy_budget - used_epsilon, 0)
-    update_budget_in_db(dataset_id, new_epsilon)
+def update_budget_in_db(dataset_id, new_budget):
+    return budget_ledger.set_remaining(dataset_id, new_budget)
 
 def is_database_admin():
     user = session.get('user')
@@ -510,20 +530,37 @@ def update_privacy_budget(dataset_id):
     except Exception as e:
         return str(e), 500
 
+@app.route('/api/datasets/privacyBudget/<dataset_id>', methods=['GET'])
+def get_privacy_budget(dataset_id):
+    return jsonify({
+        "dataset_id": dataset_id,
+        "privacyBudget": get_current_epsilon(dataset_id),
+        "history": budget_ledger.history(dataset_id, limit=request.args.get('limit', 100, type=int))
+    }), 200
 
-def validate_budget(budget):
+@app.route('/api/datasets/schema/<filename>', methods=['GET'])
+def get_schema(filename):
+    file_path = os.path.join('data', filename)
     try:
-        budget = float(budget)
-        return 0 < budget <= 1  # Adjust range as necessary
-    except ValueError:
-        return False
+        if not os.path.isfile(file_path):
+            return jsonify({"error": "File not found"}), 404
+        return jsonify(load_schema(file_path)), 200
+    except Exception as e:
+        logging.error(f"An error occurred while retrieving the schema: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/datasets/cache_stats', methods=['GET'])
+def get_cache_stats():
+    stats = dataset_cache.stats()
+    stats['thumbnails'] = thumbnail_cache.stats()
+    return jsonify(stats), 200
 
 @app.route('/api/datasets', methods=['GET'])
 def list_datasets():
     data_directory = './data'
     try:
         # List all files in the data directory
-        datasets = [f for f in os.listdir(data_directory) if os.path.isfile(os.path.join(data_directory, f))]
+        datasets = [f for f in columnar.list_datasets(data_directory) if columnar.dataset_exists(os.path.join(data_directory, f))]
         return jsonify(datasets), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -544,8 +581,14 @@ def rename_file():
 
         logging.info(f"Attempting to rename: {original_full_path} to {new_full_path}")
 
-        if os.path.exists(original_full_path):
-            os.rename(original_full_path, new_full_path)
+        if columnar.dataset_exists(original_full_path):
+            if os.path.exists(original_full_path):
+                os.rename(original_full_path, new_full_path)
+            dataset_cache.invalidate(original_full_path)
+            dataset_cache.invalidate(new_full_path)
+            rename_sidecars(original_full_path, new_full_path)
+            budget_ledger.rename(os.path.basename(original_full_path), new_file_name)
+            generator_store.rename_dataset(os.path.basename(original_full_path), new_file_name)
             logging.info(f"File renamed from {original_full_path} to {new_full_path}")
             return jsonify({"message": "File renamed successfully", "new_file_path": new_full_path}), 200
         else:
@@ -574,8 +617,13 @@ def delete_file():
         logging.info(f"Attempting to delete: {full_file_path}")
 
         # Checking if the file exists and deleting it
-        if os.path.exists(full_file_path):
-            os.remove(full_file_path)
+        if columnar.dataset_exists(full_file_path):
+            if os.path.exists(full_file_path):
+                os.remove(full_file_path)
+            dataset_cache.invalidate(full_file_path)
+            remove_sidecars(full_file_path)
+            # Generators trained on the dataset are of no further use once it is gone
+            generator_store.evict_dataset(original_file_name)
             logging.info(f"File {full_file_path} deleted successfully")
             return jsonify({"message": "File deleted successfully"}), 200
         else:
@@ -586,49 +634,31 @@ def delete_file():
         logging.error(f"An error occurred: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def calculate_sensitivity(data, column):
-    """Calculate the global sensitivity for the mean."""
-    max_value = data[column].max()
-    min_value = data[column].min()
-    num_records = len(data)
-    return (max_value - min_value) / num_records
-
-def determine_epsilon(total_queries, privacy_budget, base_epsilon=0.1, risk_tolerance=0.5):
-    """Dynamically determine epsilon based on operational parameters."""
-    epsilon_decay = base_epsilon / total_queries  # Adjust epsilon based on the total number of queries
-    epsilon_budget_adjusted = privacy_budget * risk_tolerance  # Adjust epsilon based on the remaining privacy budget and risk tolerance
-    return min(epsilon_decay, epsilon_budget_adjusted)  # Choose the smaller epsilon for stronger privacy
-
-def calculate_noisy_statistic(data, column, epsilon, operation):
-    """Apply differential privacy noise based on the operation."""
-    sensitivity = calculate_sensitivity(data, column) if operation in ['mean', 'median'] else 1
-    actual_value = getattr(data[column], operation)() if operation != 'mode' else data[column].mode()[0]
-    noise = np.random.laplace(0, sensitivity/epsilon)  # Apply noise based on sensitivity
-    return actual_value + noise
-
 @app.route('/get_noisy/<operation>', methods=['POST'])
 def get_noisy_statistic(operation):
     data = request.json
-    privacy_budget = float(data['privacyBudget'])
     file_name = data['fileName']
     column_name = data['columnName']
     total_queries = data['totalQueries']
+    # The budget is tracked by the server; a privacyBudget sent by the client is ignored
+    privacy_budget = get_current_epsilon(file_name)
 
     file_path = os.path.join('data', file_name)
-    df = pd.read_csv(file_path)
 
     print(data)
     print(column_name)
     try:
         # Dynamically determine epsilon
         epsilon_used = determine_epsilon(total_queries, privacy_budget)
-
-        # Ensure that the epsilon used does not exceed the remaining privacy budget
-        if epsilon_used > privacy_budget:
+        if epsilon_used <= 0:
             return jsonify({"error": "Not enough privacy budget"}), 400
 
-        statistic_value = calculate_noisy_statistic(df, column_name, epsilon_used, operation)
-        new_privacy_budget = max(privacy_budget - epsilon_used, 0)
+        # Large files are aggregated in one streaming pass instead of being loaded whole
+        statistic_value = noisy_column_statistic(file_path, column_name, epsilon_used, operation)
+
+        # Ensure that the epsilon used does not exceed the remaining privacy budget; the
+        # check and the deduction are one transaction, so concurrent queries cannot overspend
+        new_privacy_budget = deduct_epsilon(file_name, epsilon_used, reason=f"{operation} {column_name}")
 
         print(f"Privacy loss (epsilon reduction): {epsilon_used}")
 
@@ -636,30 +666,88 @@ def get_noisy_statistic(operation):
             "updatedPrivacyBudget": new_privacy_budget,
             "statisticValue": statistic_value
         })
-    except ValueError as e:
+    except (ValueError, InsufficientBudgetError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/get_noisy_batch', methods=['POST'])
+def get_noisy_statistics_batch():
+    """
+    Answer several noisy statistics in one call.
+
+    The body holds totalQueries and 'queries', a list of {fileName, columnName, operation};
+    fileName and columnName default to top-level values. The queries on each dataset
+    share one batch budget (see determine_batch_epsilons), and all budgets are charged in
+    a single ledger transaction. epsilonUsed is what the ledger charged each dataset.
+    """
+    data = request.json
+    try:
+        total_queries = data['totalQueries']
+        queries = [
+            {
+                "fileName": query.get('fileName', data.get('fileName')),
+                "columnName": query.get('columnName', data.get('columnName')),
+                "operation": query.get('operation'),
+            }
+            for query in data.get('queries', [])
+        ]
+
+        # Each dataset's batch budget is taken from its budget as it stands before the
+        # batch and split across the dataset's queries
+        positions = {}
+        for position, query in enumerate(queries):
+            positions.setdefault(query['fileName'], []).append(position)
+        epsilons = [0.0] * len(queries)
+        amounts = {}
+        for file_name, file_positions in positions.items():
+            amounts[file_name] = determine_batch_epsilons(len(file_positions), total_queries,
+                                                          get_current_epsilon(file_name))
+            for position, epsilon in zip(file_positions, amounts[file_name]):
+                epsilons[position] = epsilon
+
+        results = answer_queries(queries, epsilons)
+        # The ledger composes each file's queries under RDP rather than adding them up
+        charges = budget_ledger.charge_many(amounts, reason=f"batch of {len(queries)} queries")
+        new_privacy_budgets = {file_name: remaining for file_name, (remaining, _) in charges.items()}
+        epsilon_used = {file_name: charged for file_name, (_, charged) in charges.items()}
+
+        print(f"Privacy loss (epsilon reduction): {epsilon_used} for {len(queries)} queries")
+
+        return jsonify({
+            "updatedPrivacyBudgets": new_privacy_budgets,
+            "epsilonUsed": epsilon_used,
+            "results": results
+        })
+    except (KeyError, TypeError, ValueError, ZeroDivisionError, InsufficientBudgetError) as e:
         return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    if not chatbot.enabled:
+        return jsonify({"error": "Chatbot is disabled"}), 503
     # Start the WebSocket event, this will be picked up by the 'message' event handler
     return jsonify({'reply': "WebSocket event started"})
 
+@app.route('/chat/warmup', methods=['POST'])
+def chat_warmup():
+    try:
+        if not chatbot.warm_up():
+            return jsonify({"error": "Chatbot is disabled"}), 503
+        return jsonify({"message": "Chatbot model loaded"}), 200
+    except Exception as e:
+        logging.error(f"An error occurred while loading the chatbot: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @socketio.on('message')
 def handle_message(data):
     user_message = data['message']
-    
-    # Process the user_message just like before
-    messages = [
-        {"role": "system", "content": "You are a friendly AI assistant."},
-        {"role": "user", "content": user_message},
-    ]
-    # Apply chat template
-    prompt = pipe.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    # Generate a response using the pipeline
-    outputs = pipe(prompt, max_new_tokens=256, do_sample=True, temperature=0.7, top_k=50, top_p=0.95)
-    full_response = outputs[0]["generated_text"]
-    reply_parts = full_response.split("<|assistant|>")
-    chatbot_reply = reply_parts[-1].strip() if len(reply_parts) > 1 else full_response.strip()
+
+    try:
+        chatbot_reply = chatbot.reply(user_message)
+    except ChatbotDisabledError as e:
+        emit('response', {'error': str(e)})
+        return
     emit('response', {'word': '<NEW_MESSAGE>'})  # Start of a new message
     for char in chatbot_reply:  # Iterate through characters instead of words
         emit('response', {'char': char})  # Emit the character
@@ -684,6 +772,9 @@ def run_code():
     datasetSource = data.get('datasetSource')
     encryptedHFAccessToken = data.get('encryptedHFAccessToken')
 
+    from google.oauth2 import service_account
+    from googleapiclient import discovery
+
     # Load your service account credentials
     credentials = service_account.Credentials.from_service_account_file(
         'service-account-key.json'
@@ -0,0 +1,81 @@
+# dpgan_images_throughput.py
+#
+# Training throughput of the private image GAN in images/sec on the CPU. Per-example
+# gradients are computed either vectorized (pfor) or with a loop over the batch.
+#
+# Usage (from the backend directory):
+#   python benchmarks/dpgan_images_throughput.py --images 60000 --steps 20 --loop
+
+import argparse
+import os
+import sys
+import time
+
+# Pin the comparison to the CPU so results are comparable between machines
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+
+from algorithms.dp_gan_images import DPGANImages
+from algorithms.input_pipeline import POISSON, build_input_pipeline
+
+NOISE_DIM = 100
+NOISE_MULTIPLIER = 1.1
+L2_NORM_CLIP = 1.0
+
+
+def measure(vectorized, images, batch_size, steps, warmup):
+    algorithm = DPGANImages(vectorized=vectorized)
+    generator = algorithm.build_cnn_generator()
+    discriminator = algorithm.build_cnn_discriminator()
+    _, _, generator_optimizer, discriminator_optimizer = algorithm.build_optimizers(L2_NORM_CLIP, NOISE_MULTIPLIER)
+    train_step = algorithm.make_train_step(generator, discriminator, generator_optimizer, discriminator_optimizer,
+                                           NOISE_DIM, expected_batch_size=batch_size)
+
+    batches = build_input_pipeline(images, batch_size, sampling=POISSON, preprocess=algorithm.preprocess_images, seed=0)
+    iterator = iter(batches.repeat())
+    # The first calls include tracing
+    for _ in range(warmup):
+        train_step(next(iterator))
+
+    num_images = 0
+    total_loss = tf.zeros([])
+    start = time.perf_counter()
+    for _ in range(steps):
+        image_batch = next(iterator)
+        gen_loss, _ = train_step(image_batch)
+        total_loss += gen_loss
+        num_images += int(image_batch.shape[0])
+    total_loss.numpy()  # Wait for the queued steps to finish
+    return num_images / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure private image GAN training throughput")
+    parser.add_argument("--images", type=int, default=60000, help="Number of synthetic 28x28 training images")
+    parser.add_argument("--batch-size", type=int, default=256, help="Expected images per step")
+    parser.add_argument("--steps", type=int, default=20, help="Timed steps per mode")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed steps per mode")
+    parser.add_argument("--loop", action="store_true", help="Also measure per-example gradients without pfor")
+    args = parser.parse_args()
+
+    images = np.random.default_rng(0).integers(0, 256, size=(args.images, 28, 28), dtype=np.uint8)
+
+    modes = {"vectorized": True}
+    if args.loop:
+        modes["loop"] = False
+    results = {mode: measure(vectorized, images, args.batch_size, args.steps, args.warmup)
+               for mode, vectorized in modes.items()}
+
+    print(f"{args.images} images, expected batch size {args.batch_size}, {args.steps} steps per mode")
+    print(f"{'mode':<12}{'images/sec':>12}{'epoch [s]':>12}")
+    for mode, images_per_sec in results.items():
+        print(f"{mode:<12}{images_per_sec:>12.1f}{args.images / images_per_sec:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# dpgan_train_step.py
+#
+# Throughput of one DP-GAN training step, eager versus tf.function (and optionally XLA).
+# Trains on a synthetic 1-5 rating column on the CPU and prints steps/sec per mode.
+#
+# Usage (from the backend directory):
+#   python benchmarks/dpgan_train_step.py --rows 1000000 --steps 200 --batch-size 1000 --xla
+
+import argparse
+import os
+import sys
+import time
+
+# Pin the comparison to the CPU so results are comparable between machines
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import tensorflow as tf
+
+from algorithms.dp_gan import DPGAN
+
+NOISE_DIM = 1
+NOISE_MULTIPLIER = 1.1
+L2_NORM_CLIP = 1.0
+LOWER_CLIP = 0
+UPPER_CLIP = 5
+# Fixed loss targets; computing them privately is not part of the step being measured
+TARGETS = {"mean": 3.0, "median": 3.0, "min": 1.0, "max": 5.0}
+
+
+def measure(mode, batches, steps, warmup):
+    algorithm = DPGAN(compile_step=mode != "eager", jit_compile=mode == "xla")
+    generator = algorithm.build_generator()
+    discriminator = algorithm.build_discriminator()
+    discriminator_schedule, generator_schedule = algorithm.build_schedules()
+    optimizer, non_dp_optimizer = algorithm.build_optimizers(discriminator_schedule, generator_schedule,
+                                                             L2_NORM_CLIP, NOISE_MULTIPLIER)
+    train_step = algorithm.make_train_step(generator, discriminator, optimizer, non_dp_optimizer, NOISE_DIM,
+                                           TARGETS, LOWER_CLIP, UPPER_CLIP)
+
+    iterator = iter(batches.repeat())
+    # The first calls include tracing and compilation
+    for _ in range(warmup):
+        train_step(next(iterator))
+
+    total_g_loss = tf.zeros([])
+    start = time.perf_counter()
+    for _ in range(steps):
+        g_loss, _ = train_step(next(iterator))
+        total_g_loss += g_loss
+    total_g_loss.numpy()  # Wait for the queued steps to finish
+    return steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare eager and compiled DP-GAN training steps")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows in the synthetic rating column")
+    parser.add_argument("--steps", type=int, default=200, help="Timed steps per mode")
+    parser.add_argument("--batch-size", type=int, default=100, help="Records per step")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed steps per mode")
+    parser.add_argument("--xla", action="store_true", help="Also measure the XLA-compiled step")
+    args = parser.parse_args()
+
+    ratings = np.random.default_rng(0).integers(1, 6, size=args.rows)
+    batches = tf.data.Dataset.from_tensor_slices(ratings).batch(args.batch_size).map(
+        lambda batch: tf.reshape(tf.cast(batch, tf.float32), [-1, 1])).prefetch(tf.data.AUTOTUNE)
+
+    modes = ["eager", "function"] + (["xla"] if args.xla else [])
+    results = {mode: measure(mode, batches, args.steps, args.warmup) for mode in modes}
+
+    print(f"{args.rows} rows, batch size {args.batch_size}, {args.steps} steps per mode")
+    print(f"{'mode':<12}{'steps/sec':>12}{'speed-up':>12}")
+    for mode, steps_per_sec in results.items():
+        print(f"{mode:<12}{steps_per_sec:>12.1f}{steps_per_sec / results['eager']:>11.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# startup_time.py
+#
+# Cold-start report for the backend. Imports app.py in fresh interpreters with
+# `python -X importtime`, prints the slowest imports and exits non-zero when the
+# median start-up time exceeds the budget or an ML framework is imported eagerly.
+#
+# Usage (from the backend directory):
+#   python benchmarks/startup_time.py --budget 1.0 --runs 5
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that the CSV / statistics endpoints must not pay for at start-up
+DEFERRED_MODULES = [
+    "tensorflow",
+    "tensorflow_privacy",
+    "tensorflow_probability",
+    "torch",
+    "opacus",
+    "transformers",
+    "googleapiclient",
+]
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output.
+
+    Every top-level package is charged the cumulative time of its outermost imports, at
+    any depth, so dependencies nested under the imported module are reported too.
+
+    Returns:
+    dict: Top-level package name -> cumulative import time in seconds.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        name = parts[2][1:]
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((depth, name.strip().split(".")[0], int(parts[1])))
+
+    cumulative = {}
+    # Imports are listed after the imports they trigger, so walking the entries backwards
+    # visits every import before its nested ones; ancestors holds the packages enclosing it
+    ancestors = []
+    for depth, top_level, cumulative_us in reversed(entries):
+        del ancestors[depth:]
+        if top_level not in ancestors:
+            cumulative[top_level] = cumulative.get(top_level, 0.0) + cumulative_us / 1e6
+        ancestors.append(top_level)
+    return cumulative
+
+
+def run_once(module):
+    env = dict(os.environ, CHATBOT_ENABLED="0", CHATBOT_WARMUP="0")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}; import sys; print(','.join(sys.modules))"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    loaded = set(result.stdout.strip().split(","))
+    return elapsed, parse_importtime(result.stderr), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend cold-start time")
+    parser.add_argument("--module", default="app", help="Module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    parser.add_argument("--budget", type=float, default=float(os.environ.get("STARTUP_BUDGET_SECONDS", 1.0)),
+                        help="Maximum median start-up time in seconds")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest packages to print")
+    args = parser.parse_args()
+
+    timings = []
+    package_times = {}
+    loaded = set()
+    for _ in range(args.runs):
+        elapsed, packages, loaded = run_once(args.module)
+        timings.append(elapsed)
+        for name, seconds in packages.items():
+            package_times.setdefault(name, []).append(seconds)
+
+    median = statistics.median(timings)
+    print(f"Cold start of '{args.module}': median {median:.3f}s, min {min(timings):.3f}s over {args.runs} runs")
+    print(f"{'package':<32}{'cumulative [s]':>16}")
+    slowest = sorted(package_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, seconds in slowest[:args.top]:
+        print(f"{name:<32}{statistics.median(seconds):>16.3f}")
+
+    failures = []
+    eager = sorted(module for module in DEFERRED_MODULES if module in loaded)
+    if eager:
+        failures.append(f"ML frameworks imported at start-up: {', '.join(eager)}")
+    if median > args.budget:
+        failures.append(f"median start-up {median:.3f}s exceeds budget of {args.budget:.3f}s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: within the {args.budget:.3f}s budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
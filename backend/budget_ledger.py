@@ -0,0 +1,295 @@
+# budget_ledger.py
+#
+# Server-side privacy budget per dataset, kept in an SQLite database in WAL mode.
+# Every deduction is an atomic check-and-deduct transaction, so concurrent requests
+# (threads or processes) can never spend more than the remaining budget. Reads are
+# served from a write-through cache in this process.
+#
+# Alongside the plain sum of the epsilons spent, each dataset keeps the RDP curve of its
+# Laplace queries (see privacy_accountant.py). What a dataset has spent is the smaller
+# of the two: one query costs exactly its epsilon, while many queries compose well
+# below their sum, at the price of a (small) LEDGER_DELTA.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from privacy_accountant import DEFAULT_ORDERS, laplace_rdp, rdp_to_epsilon
+from sidecar import META_DIR
+
+DEFAULT_LEDGER_PATH = os.path.join('data', META_DIR, 'budget_ledger.sqlite3')
+DEFAULT_BUDGET = 1.0
+LEDGER_DELTA = 1e-6
+
+# Slack for floating-point error when comparing epsilons
+EPSILON_TOLERANCE = 1e-9
+
+
+class InsufficientBudgetError(Exception):
+    def __init__(self, dataset_id, requested, remaining):
+        super().__init__(f"Not enough privacy budget for {dataset_id}: "
+                         f"requested {requested}, remaining {remaining}")
+        self.dataset_id = dataset_id
+        self.requested = requested
+        self.remaining = remaining
+
+
+class BudgetLedger:
+    def __init__(self, path=DEFAULT_LEDGER_PATH, default_budget=DEFAULT_BUDGET, delta=LEDGER_DELTA):
+        """
+        Parameters:
+        path (str): SQLite database file.
+        default_budget (float): Budget of a dataset the ledger has not seen before.
+        delta (float): Delta at which composed queries are converted back to an epsilon.
+        """
+        self.path = path
+        self.default_budget = default_budget
+        self.delta = delta
+        self._local = threading.local()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.environ.get("BUDGET_LEDGER_PATH", DEFAULT_LEDGER_PATH),
+            default_budget=float(os.environ.get("DEFAULT_PRIVACY_BUDGET", DEFAULT_BUDGET)),
+            delta=float(os.environ.get("LEDGER_DELTA", LEDGER_DELTA)),
+        )
+
+    def _connection(self):
+        # SQLite connections may not be shared between threads, so each thread opens its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # isolation_level=None: transactions are started explicitly with BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints and is still safe against corruption
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._create_tables(connection)
+        return connection
+
+    def _create_tables(self, connection):
+        with self._init_lock:
+            if self._initialized:
+                return
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS budgets (
+                    dataset_id TEXT PRIMARY KEY,
+                    remaining REAL NOT NULL,
+                    spent REAL NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    total REAL,
+                    rdp TEXT
+                );
+                CREATE TABLE IF NOT EXISTS deductions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    dataset_id TEXT NOT NULL,
+                    epsilon REAL NOT NULL,
+                    reason TEXT,
+                    created_at REAL NOT NULL
+                );
+            """)
+            self._migrate(connection)
+            self._initialized = True
+
+    def _migrate(self, connection):
+        # Ledgers created before RDP accounting lack total and rdp; rebuild the curve from
+        # the recorded deductions, every one of which was a Laplace query
+        if self._has_rdp_columns(connection):
+            return
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated the ledger while this one waited for the lock
+            if self._has_rdp_columns(connection):
+                connection.execute("COMMIT")
+                return
+            connection.execute("ALTER TABLE budgets ADD COLUMN total REAL")
+            connection.execute("ALTER TABLE budgets ADD COLUMN rdp TEXT")
+            rows = connection.execute("SELECT dataset_id, remaining, spent FROM budgets").fetchall()
+            for dataset_id, remaining, spent in rows:
+                epsilons = [row[0] for row in connection.execute(
+                    "SELECT epsilon FROM deductions WHERE dataset_id = ?", (dataset_id,))]
+                rdp = sum((laplace_rdp(epsilon) for epsilon in epsilons), np.zeros(len(DEFAULT_ORDERS)))
+                connection.execute(
+                    "UPDATE budgets SET total = ?, rdp = ? WHERE dataset_id = ?",
+                    (remaining + self._spent(spent, rdp), json.dumps(rdp.tolist()), dataset_id),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _has_rdp_columns(connection):
+        return 'rdp' in {row[1] for row in connection.execute("PRAGMA table_info(budgets)")}
+
+    def _spent(self, linear, rdp):
+        # Both the plain sum and the RDP conversion are valid bounds; use the tighter one
+        return min(linear, rdp_to_epsilon(rdp, self.delta)[0])
+
+    def _load(self, connection, dataset_id):
+        row = connection.execute(
+            "SELECT total, spent, rdp FROM budgets WHERE dataset_id = ?", (dataset_id,)
+        ).fetchone()
+        if row is None:
+            return self.default_budget, 0.0, np.zeros(len(DEFAULT_ORDERS))
+        total, spent, rdp = row
+        return total, spent, np.array(json.loads(rdp)) if rdp else np.zeros(len(DEFAULT_ORDERS))
+
+    def _cache_put(self, dataset_id, remaining):
+        with self._cache_lock:
+            self._cache[dataset_id] = remaining
+
+    def remaining(self, dataset_id):
+        """Remaining budget of a dataset."""
+        with self._cache_lock:
+            if dataset_id in self._cache:
+                return self._cache[dataset_id]
+        row = self._connection().execute(
+            "SELECT remaining FROM budgets WHERE dataset_id = ?", (dataset_id,)
+        ).fetchone()
+        remaining = row[0] if row is not None else self.default_budget
+        self._cache_put(dataset_id, remaining)
+        return remaining
+
+    def deduct(self, dataset_id, epsilon, reason=None):
+        """
+        Atomically spend epsilon from a dataset's budget for one Laplace query.
+
+        Returns:
+        float: The remaining budget after the deduction.
+
+        Raises:
+        InsufficientBudgetError: If less than epsilon is left; nothing is deducted.
+        """
+        return self.deduct_many({dataset_id: epsilon}, reason=reason)[dataset_id]
+
+    def deduct_many(self, amounts, reason=None):
+        """
+        Atomically spend from several datasets' budgets in one transaction.
+
+        Parameters:
+        amounts (dict): Dataset id -> epsilon of one Laplace query, or a list of epsilons
+            for several queries, which are composed under RDP.
+        reason (str, optional): Recorded with every deduction.
+
+        Returns:
+        dict: Dataset id -> remaining budget after the deduction.
+
+        Raises:
+        InsufficientBudgetError: If any dataset has too little left; nothing is deducted.
+        """
+        return {dataset_id: remaining for dataset_id, (remaining, _) in self.charge_many(amounts, reason).items()}
+
+    def charge_many(self, amounts, reason=None):
+        """
+        Same as deduct_many, but also reports how much of each budget the deduction used.
+
+        Under RDP composition that can be less than the sum of the epsilons.
+
+        Returns:
+        dict: Dataset id -> (remaining budget, budget charged).
+        """
+        amounts = {dataset_id: [float(value) for value in (epsilons if isinstance(epsilons, (list, tuple)) else [epsilons])]
+                   for dataset_id, epsilons in amounts.items()}
+        if any(epsilon < 0 for epsilons in amounts.values() for epsilon in epsilons):
+            raise ValueError("epsilon must not be negative")
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock before reading, so no other writer can
+        # deduct between the check and the update
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            charges = {}
+            for dataset_id, epsilons in amounts.items():
+                total, spent, rdp = self._load(connection, dataset_id)
+                epsilon = sum(epsilons)
+                new_spent = spent + epsilon
+                new_rdp = sum((laplace_rdp(value) for value in epsilons), rdp)
+                if self._spent(new_spent, new_rdp) > total + EPSILON_TOLERANCE:
+                    remaining = total - self._spent(spent, rdp)
+                    self._cache_put(dataset_id, remaining)
+                    raise InsufficientBudgetError(dataset_id, epsilon, remaining)
+
+                remaining = max(total - self._spent(new_spent, new_rdp), 0.0)
+                charges[dataset_id] = (remaining, self._spent(new_spent, new_rdp) - self._spent(spent, rdp))
+                connection.execute(
+                    "INSERT INTO budgets (dataset_id, remaining, spent, updated_at, total, rdp) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(dataset_id) DO UPDATE SET remaining = excluded.remaining, spent = excluded.spent, "
+                    "updated_at = excluded.updated_at, total = excluded.total, rdp = excluded.rdp",
+                    (dataset_id, remaining, new_spent, now, total, json.dumps(new_rdp.tolist())),
+                )
+                connection.execute(
+                    "INSERT INTO deductions (dataset_id, epsilon, reason, created_at) VALUES (?, ?, ?, ?)",
+                    (dataset_id, epsilon, reason, now),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        for dataset_id, (remaining, _) in charges.items():
+            self._cache_put(dataset_id, remaining)
+        return charges
+
+    def set_remaining(self, dataset_id, budget):
+        """Set a dataset's remaining budget, e.g. when an administrator grants a new one."""
+        budget = float(budget)
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # Past queries stay in the composition; the new budget is on top of what they spent
+            total, spent, rdp = self._load(connection, dataset_id)
+            connection.execute(
+                "INSERT INTO budgets (dataset_id, remaining, spent, updated_at, total, rdp) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(dataset_id) DO UPDATE SET remaining = excluded.remaining, "
+                "updated_at = excluded.updated_at, total = excluded.total",
+                (dataset_id, budget, spent, time.time(), self._spent(spent, rdp) + budget, json.dumps(rdp.tolist())),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        self._cache_put(dataset_id, budget)
+        return budget
+
+    def rename(self, old_dataset_id, new_dataset_id):
+        """Move a dataset's budget and history to a new id, so renaming a file does not reset its budget."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM budgets WHERE dataset_id = ?", (new_dataset_id,))
+            connection.execute("UPDATE budgets SET dataset_id = ? WHERE dataset_id = ?", (new_dataset_id, old_dataset_id))
+            connection.execute("UPDATE deductions SET dataset_id = ? WHERE dataset_id = ?", (new_dataset_id, old_dataset_id))
+            connection.execute("COMMIT")
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        with self._cache_lock:
+            self._cache.pop(old_dataset_id, None)
+            self._cache.pop(new_dataset_id, None)
+
+    def history(self, dataset_id, limit=100):
+        """Most recent deductions of a dataset, newest first."""
+        rows = self._connection().execute(
+            "SELECT epsilon, reason, created_at FROM deductions WHERE dataset_id = ? "
+            "ORDER BY id DESC LIMIT ?", (dataset_id, limit)
+        ).fetchall()
+        return [{"epsilon": epsilon, "reason": reason, "created_at": created_at}
+                for epsilon, reason, created_at in rows]
+
+
+# Shared by every request handled by this process
+budget_ledger = BudgetLedger.from_env()
@@ -0,0 +1,137 @@
+# chatbot.py
+
+import logging
+import os
+import threading
+import time
+
+DEFAULT_MODEL_NAME = "dzagardo/tiny-llama-orca-amp-gclip-dp-pa-sgd-dz-v1.1.1000"
+
+
+class ChatbotDisabledError(RuntimeError):
+    pass
+
+
+class ChatbotService:
+    """
+    Lazily loaded text-generation pipeline for the /chat assistant.
+
+    The model is only loaded on the first reply (or an explicit warm_up()) and is
+    released again once it has been idle for idle_timeout seconds.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, enabled=True, idle_timeout=900):
+        self.model_name = model_name
+        self.enabled = enabled
+        self.idle_timeout = idle_timeout
+        self._pipe = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._idle_timer = None
+
+    @classmethod
+    def from_env(cls):
+        """Build the service from the CHATBOT_* environment variables."""
+        return cls(
+            model_name=os.environ.get("CHATBOT_MODEL_NAME", DEFAULT_MODEL_NAME),
+            enabled=os.environ.get("CHATBOT_ENABLED", "1").lower() not in ("0", "false", "no"),
+            idle_timeout=float(os.environ.get("CHATBOT_IDLE_TIMEOUT", 900)),
+        )
+
+    @property
+    def is_loaded(self):
+        return self._pipe is not None
+
+    def _load(self):
+        # Heavy imports are deferred until the model is actually needed
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
+
+        logging.info(f"Loading chatbot model {self.model_name}")
+        start = time.time()
+        model = AutoModelForCausalLM.from_pretrained(self.model_name)
+        # Load tokenizer (assuming you are using the same tokenizer)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        # Set device to GPU if available
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, device=device)
+        logging.info(f"Chatbot model loaded in {time.time() - start:.1f}s on {device}")
+        return pipe
+
+    def get_pipeline(self):
+        """Return the loaded pipeline, loading it on first use."""
+        if not self.enabled:
+            raise ChatbotDisabledError("The chatbot is disabled (CHATBOT_ENABLED=0)")
+        with self._lock:
+            if self._pipe is None:
+                self._pipe = self._load()
+            self._last_used = time.monotonic()
+            self._schedule_idle_check(self.idle_timeout)
+            return self._pipe
+
+    def warm_up(self):
+        """Load the model ahead of the first request. Returns False when disabled."""
+        if not self.enabled:
+            return False
+        self.get_pipeline()
+        return True
+
+    def unload(self):
+        """Drop the pipeline so its memory can be reclaimed."""
+        with self._lock:
+            self._unload_locked()
+
+    def _unload_locked(self):
+        if self._pipe is None:
+            return
+        self._pipe = None
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        import gc
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logging.info("Chatbot model unloaded")
+
+    def _schedule_idle_check(self, delay):
+        if not self.idle_timeout or self.idle_timeout <= 0:
+            return
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+        self._idle_timer = threading.Timer(delay, self._check_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _check_idle(self):
+        with self._lock:
+            if self._pipe is None:
+                return
+            idle_for = time.monotonic() - self._last_used
+            if idle_for >= self.idle_timeout:
+                self._unload_locked()
+            else:
+                self._schedule_idle_check(self.idle_timeout - idle_for)
+
+    def reply(self, user_message, **generation_kwargs):
+        """Generate the assistant reply for a single user message."""
+        pipe = self.get_pipeline()
+        messages = [
+            {"role": "system", "content": "You are a friendly AI assistant."},
+            {"role": "user", "content": user_message},
+        ]
+        # Apply chat template
+        prompt = pipe.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        # Generate a response using the pipeline
+        kwargs = dict(max_new_tokens=256, do_sample=True, temperature=0.7, top_k=50, top_p=0.95)
+        kwargs.update(generation_kwargs)
+        outputs = pipe(prompt, **kwargs)
+        with self._lock:
+            self._last_used = time.monotonic()
+        full_response = outputs[0]["generated_text"]
+        reply_parts = full_response.split("<|assistant|>")
+        return reply_parts[-1].strip() if len(reply_parts) > 1 else full_response.strip()
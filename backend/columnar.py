@@ -0,0 +1,249 @@
+# columnar.py
+#
+# Columnar (Parquet) storage for tabular datasets.
+#
+# Datasets keep their user-facing CSV name (e.g. 'data/ratings.csv'). Uploaded CSVs are
+# converted once into a Parquet sidecar that endpoints read column by column; synthetic
+# outputs are written as Parquet only and turned into CSV when they are downloaded.
+# Without pyarrow installed everything falls back to plain CSV files.
+
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from sidecar import META_DIR, ensure_meta_dir, register_suffix, sidecar_path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+COLUMNAR_SUFFIX = register_suffix('parquet')
+_SOURCE_KEY = b'dp_deployment.source'
+
+
+def is_available():
+    return pq is not None
+
+
+def columnar_path(file_path):
+    return sidecar_path(file_path, COLUMNAR_SUFFIX)
+
+
+def _source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _stored_source(path):
+    metadata = pq.read_schema(path).metadata or {}
+    source = metadata.get(_SOURCE_KEY)
+    return json.loads(source) if source else None
+
+
+def _write_atomically(path, write):
+    # write(tmp_path) fills a uniquely named temporary file that then replaces path, so
+    # concurrent writers of the same path cannot clobber each other's partial output
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.",
+                                    suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_table(table, path, source=None):
+    metadata = dict(table.schema.metadata or {})
+    if source is not None:
+        metadata[_SOURCE_KEY] = json.dumps(source).encode()
+    table = table.replace_schema_metadata(metadata)
+    _write_atomically(path, lambda tmp_path: pq.write_table(table, tmp_path))
+
+
+def is_virtual(file_path):
+    """True for datasets that only exist in columnar form (e.g. not yet downloaded outputs)."""
+    return not os.path.isfile(file_path) and is_available() and os.path.isfile(columnar_path(file_path))
+
+
+def dataset_exists(file_path):
+    return os.path.isfile(file_path) or is_virtual(file_path)
+
+
+def has_fresh_columnar(file_path):
+    """True if a Parquet copy exists that matches the current contents of file_path."""
+    if not is_available():
+        return False
+    path = columnar_path(file_path)
+    if not os.path.isfile(path):
+        return False
+    if not os.path.isfile(file_path):
+        return True
+    try:
+        return _stored_source(path) == _source_stamp(file_path)
+    except Exception:
+        return False
+
+
+def backing_path(file_path):
+    """The physical file whose mtime/size identifies the current version of a dataset."""
+    return file_path if os.path.isfile(file_path) else columnar_path(file_path)
+
+
+def ingest(file_path):
+    """
+    Convert an uploaded CSV into its Parquet sidecar.
+
+    Returns:
+    bool: True if a columnar copy was written.
+    """
+    if not is_available():
+        return False
+    source = _source_stamp(file_path)
+    # Parse with pandas so column types match what the CSV code paths have always seen
+    table = pa.Table.from_pandas(pd.read_csv(file_path), preserve_index=False)
+    ensure_meta_dir(file_path)
+    _write_table(table, columnar_path(file_path), source=source)
+    logging.info(f"Ingested {file_path} into {columnar_path(file_path)}")
+    return True
+
+
+def read_columns(file_path, columns=None):
+    """
+    Load a dataset, reading only the requested columns when a columnar copy exists.
+
+    Parameters:
+    file_path (str): User-facing path of the dataset.
+    columns (list, optional): Column names to load; all columns when omitted.
+
+    Returns:
+    pd.DataFrame
+    """
+    columns = list(columns) if columns is not None else None
+    if has_fresh_columnar(file_path):
+        return pq.read_table(columnar_path(file_path), columns=columns).to_pandas()
+    return pd.read_csv(file_path, usecols=columns)
+
+
+def iter_chunks(file_path, columns, chunk_rows=1 << 20):
+    """
+    Read columns of a dataset in chunks, so files larger than memory can be scanned.
+
+    Yields:
+    pd.DataFrame: Up to chunk_rows consecutive rows of the requested columns.
+    """
+    columns = list(columns)
+    if has_fresh_columnar(file_path):
+        parquet_file = pq.ParquetFile(columnar_path(file_path))
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(file_path, usecols=columns, chunksize=chunk_rows)
+
+
+def column_names(file_path):
+    if has_fresh_columnar(file_path):
+        return list(pq.read_schema(columnar_path(file_path)).names)
+    return pd.read_csv(file_path, nrows=0).columns.tolist()
+
+
+def columnar_schema(file_path):
+    """Schema record (same shape as schema.sniff_schema) read from the Parquet footer."""
+    path = columnar_path(file_path)
+    parquet_file = pq.ParquetFile(path)
+    pandas_schema = parquet_file.schema_arrow.empty_table().to_pandas().dtypes
+    rows = parquet_file.metadata.num_rows
+    return {
+        "source": _source_stamp(path),
+        "columns": [{"name": str(name), "dtype": str(dtype)} for name, dtype in pandas_schema.items()],
+        "sample_rows": rows,
+        "estimated_rows": rows,
+        "row_count_exact": True,
+    }
+
+
+def write_with_column(source_path, output_path, column_name, values):
+    """
+    Write a copy of the dataset at source_path with one column replaced.
+
+    With pyarrow the copy is stored in columnar form only, under the sidecar of output_path;
+    the CSV is produced later by materialize_csv. Otherwise a CSV is written directly.
+    """
+    write_with_columns(source_path, output_path, {column_name: values})
+
+
+def write_with_columns(source_path, output_path, columns):
+    """
+    Write a copy of the dataset at source_path with several columns replaced at once.
+
+    Parameters:
+    source_path (str): The original dataset.
+    output_path (str): Path of the new dataset.
+    columns (dict): Column name -> new values, one per row.
+    """
+    columns = {name: _flatten(values) for name, values in columns.items()}
+    if is_available() and has_fresh_columnar(source_path):
+        table = pq.read_table(columnar_path(source_path))
+        for column_name, values in columns.items():
+            index = table.schema.get_field_index(column_name)
+            table = table.set_column(index, column_name, pa.array(values))
+        ensure_meta_dir(output_path)
+        _write_table(table, columnar_path(output_path))
+        return
+
+    data = read_columns(source_path)
+    data = data.assign(**columns)
+    write_dataset(data, output_path)
+
+
+def _flatten(values):
+    # One value per row; generators return (n, 1) arrays
+    values = np.asarray(values)
+    if values.ndim == 1:
+        return values
+    if values.ndim == 0 or values.size != len(values):
+        raise ValueError(f"Expected one value per row, got an array of shape {values.shape}")
+    return values.reshape(len(values))
+
+
+def write_dataset(data, output_path):
+    """Store a DataFrame under output_path (columnar when available, CSV otherwise)."""
+    if is_available():
+        ensure_meta_dir(output_path)
+        _write_table(pa.Table.from_pandas(data, preserve_index=False), columnar_path(output_path))
+    else:
+        data.to_csv(output_path, index=False)
+
+
+def materialize_csv(file_path):
+    """Produce the CSV of a columnar-only dataset, e.g. right before it is downloaded."""
+    if os.path.isfile(file_path) or not is_virtual(file_path):
+        return file_path
+    path = columnar_path(file_path)
+    table = pq.read_table(path)
+    _write_atomically(file_path, lambda tmp_path: table.to_pandas().to_csv(tmp_path, index=False))
+    # The Parquet copy now mirrors the CSV; stamp it so it keeps being used for reads
+    _write_table(table, path, source=_source_stamp(file_path))
+    return file_path
+
+
+def list_datasets(directory):
+    """File names in directory, including datasets that so far only exist in columnar form."""
+    names = [f for f in os.listdir(directory) if f != META_DIR]
+    meta_dir = os.path.join(directory, META_DIR)
+    if is_available() and os.path.isdir(meta_dir):
+        suffix = f".{COLUMNAR_SUFFIX}"
+        for entry in os.listdir(meta_dir):
+            if entry.endswith(suffix):
+                name = entry[:-len(suffix)]
+                if not os.path.exists(os.path.join(directory, name)):
+                    names.append(name)
+    return names
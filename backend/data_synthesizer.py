@@ -6,73 +6,139 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import Dataset, DataLoader
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder
 from opacus import PrivacyEngine
 
-class RatingsDataset(Dataset):
-    def __init__(self, ratings):
-        self.ratings = ratings
+RATING_CATEGORIES = (1, 2, 3, 4, 5)
+# Rows sampled per model call in generate_synthetic_data
+DEFAULT_SAMPLE_CHUNK_SIZE = 1 << 16
+# Most probabilities held per model call, so wide category domains use smaller chunks
+MAX_SAMPLE_CHUNK_CELLS = 1 << 24
+# Size of the random input the classifier maps to a category distribution
+DEFAULT_NOISE_DIM = 16
+
+class CategoryDataset(Dataset):
+    def __init__(self, codes):
+        self.codes = codes
 
     def __len__(self):
-        return len(self.ratings)
+        return len(self.codes)
 
     def __getitem__(self, idx):
-        return self.ratings[idx]
-
-def load_data(file_path):
-    data = pd.read_csv(file_path)
-    ratings = data['rating'].values.reshape(-1, 1)
-    encoder = OneHotEncoder(sparse=False)
-    ratings_encoded = encoder.fit_transform(ratings)
-    return ratings_encoded
-
-class RatingClassifier(nn.Module):
-    def __init__(self):
-        super(RatingClassifier, self).__init__()
-        self.fc1 = nn.Linear(5, 64)  # Assuming input shape is (5,)
-        self.fc2 = nn.Linear(64, 5)  # Assuming 5 rating categories
+        return self.codes[idx]
+
+def encode_column(values, categories=None):
+    """
+    Encode a categorical column as integer codes.
+
+    Codes are kept as one int64 per row instead of a dense one-hot matrix, so memory is
+    O(n) whatever the number of categories.
+
+    Parameters:
+    values (array-like): The column.
+    categories (array-like, optional): The category domain. Values outside it are dropped.
+        By default the distinct values of the column are used.
+    Missing values are dropped in both cases.
+
+    Returns:
+    tuple: (codes as np.ndarray of int64, categories as np.ndarray)
+    """
+    if categories is None:
+        # factorize gives missing values the code -1, which is not a valid class index
+        codes, categories = pd.factorize(pd.Series(values).dropna(), sort=True)
+        return codes.astype(np.int64), np.asarray(categories)
+
+    categories = np.asarray(categories)
+    codes = pd.Categorical(values, categories=categories).codes.astype(np.int64)
+    return codes[codes >= 0], categories
+
+def load_data(file_path, column_name='rating', categories=None):
+    data = pd.read_csv(file_path, usecols=[column_name])
+    return encode_column(data[column_name].values, categories)
+
+class CategoricalClassifier(nn.Module):
+    def __init__(self, num_categories, noise_dim=DEFAULT_NOISE_DIM, hidden_dim=64):
+        super(CategoricalClassifier, self).__init__()
+        self.noise_dim = noise_dim
+        self.fc1 = nn.Linear(noise_dim, hidden_dim)
+        self.fc2 = nn.Linear(hidden_dim, num_categories)  # One logit per category
 
     def forward(self, x):
         x = torch.relu(self.fc1(x))
-        x = torch.softmax(self.fc2(x), dim=1)
-        return x
-
-def prepare_data(file_path):
-    ratings_encoded = load_data(file_path)
-    X_train, X_test, y_train, y_test = train_test_split(
-        ratings_encoded, ratings_encoded, test_size=0.2, random_state=42)
-    
-    train_dataset = RatingsDataset(torch.tensor(X_train, dtype=torch.float32))
-    test_dataset = RatingsDataset(torch.tensor(X_test, dtype=torch.float32))
-
-    train_loader = DataLoader(train_dataset, batch_size=64, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=64, shuffle=False)
+        return self.fc2(x)
+
+def prepare_data(codes, batch_size=64):
+    X_train, X_test = train_test_split(codes, test_size=0.2, random_state=42)
+
+    train_dataset = CategoryDataset(torch.as_tensor(X_train, dtype=torch.long))
+    test_dataset = CategoryDataset(torch.as_tensor(X_test, dtype=torch.long))
+
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
     return train_loader, test_loader
 
-def train_model(model, train_loader, optimizer, epochs):
+def train_model(model, train_loader, optimizer, epochs, noise_dim=DEFAULT_NOISE_DIM, progress_callback=None):
+    # The model learns to map random inputs to the distribution of the column's categories;
+    # targets are class indices, so no one-hot matrix is ever built
     criterion = nn.CrossEntropyLoss()
     for epoch in range(epochs):
-        for data in train_loader:
-            inputs = data.float()
+        total_loss = 0.0
+        num_batches = 0
+        for targets in train_loader:
+            if len(targets) == 0:
+                continue  # Poisson sampling can produce empty batches
+            inputs = torch.rand(len(targets), noise_dim)
             optimizer.zero_grad()
             outputs = model(inputs)
-            loss = criterion(outputs, inputs)
+            loss = criterion(outputs, targets)
             loss.backward()
             optimizer.step()
-
-def generate_synthetic_data(model, sample_size):
-    synthetic_data = []
+            total_loss += loss.item()
+            num_batches += 1
+        if progress_callback is not None:
+            progress_callback(epoch + 1, epochs, loss=total_loss / max(num_batches, 1))
+
+def generate_synthetic_data(model, sample_size, categories=RATING_CATEGORIES, chunk_size=DEFAULT_SAMPLE_CHUNK_SIZE,
+                            noise_dim=DEFAULT_NOISE_DIM):
+    """
+    Sample synthetic values from the model's predicted category distributions.
+
+    The model is run on chunks of random inputs, and one category per row is drawn by
+    inverse-CDF sampling over the whole softmax matrix at once.
+
+    Parameters:
+    model (nn.Module): Trained classifier taking noise_dim random features.
+    sample_size (int): Number of values to generate.
+    categories (sequence): Value of each output class.
+    chunk_size (int): Rows per model call; reduced so that chunk_size * len(categories) stays
+        within MAX_SAMPLE_CHUNK_CELLS.
+    noise_dim (int): Size of the model's random input.
+
+    Returns:
+    np.ndarray: The synthetic values.
+    """
+    categories = np.asarray(categories)
+    num_categories = len(categories)
+    chunk_size = max(1, min(chunk_size, MAX_SAMPLE_CHUNK_CELLS // num_categories))
+    rng = np.random.default_rng()
+    synthetic_data = np.empty(sample_size, dtype=categories.dtype)
     with torch.no_grad():
-        for _ in range(sample_size):
-            random_input = torch.tensor(np.random.rand(1, 5), dtype=torch.float32)
-            predicted_distribution = model(random_input).numpy()[0]
-            synthetic_rating = np.random.choice([1, 2, 3, 4, 5], p=predicted_distribution)
-            synthetic_data.append(synthetic_rating)
+        for start in range(0, sample_size, chunk_size):
+            stop = min(start + chunk_size, sample_size)
+            random_input = torch.rand(stop - start, noise_dim)
+            predicted_distributions = torch.softmax(model(random_input), dim=1).numpy()
+
+            # Inverse CDF: count the cumulative probabilities each uniform draw exceeds.
+            # Draws are scaled by the row total so rounding in the softmax cannot overrun it.
+            cdf = np.cumsum(predicted_distributions, axis=1)
+            draws = rng.random((stop - start, 1)) * cdf[:, -1:]
+            indices = np.minimum((draws >= cdf).sum(axis=1), num_categories - 1)
+            synthetic_data[start:stop] = categories[indices]
     return synthetic_data
 
-def generate_private_data(file_path, sample_size, target_epsilon, target_delta, epochs):
-    train_loader, test_loader = prepare_data(file_path)
-    model = RatingClassifier()
+def train_private_model(codes, num_categories, target_epsilon, target_delta, epochs, noise_dim=DEFAULT_NOISE_DIM,
+                        progress_callback=None):
+    train_loader, test_loader = prepare_data(codes)
+    model = CategoricalClassifier(num_categories, noise_dim=noise_dim)
 
     optimizer = optim.Adam(model.parameters())
     privacy_engine = PrivacyEngine()
@@ -87,11 +153,17 @@ def generate_private_data(file_path, sample_size, target_epsilon, target_delta,
         max_grad_norm=1.0
     )
 
-    train_model(model, train_loader, optimizer, epochs)
+    train_model(model, train_loader, optimizer, epochs, noise_dim=noise_dim, progress_callback=progress_callback)
+    return model
+
+def generate_private_data(file_path, sample_size, target_epsilon, target_delta, epochs, column_name='rating',
+                          categories=RATING_CATEGORIES):
+    codes, categories = load_data(file_path, column_name, categories)
+    model = train_private_model(codes, len(categories), target_epsilon, target_delta, epochs)
 
-    synthetic_data = generate_synthetic_data(model, sample_size)
+    synthetic_data = generate_synthetic_data(model, sample_size, categories)
     return synthetic_data
 
 # Example usage:
-# synthetic_ratings = generate_private_data('preprocessed_10000_entries.csv', 1000)
+# synthetic_ratings = generate_private_data('preprocessed_10000_entries.csv', 1000, 1.0, 1e-5, 5)
 # print(synthetic_ratings)
@@ -0,0 +1,122 @@
+# dataset_cache.py
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import columnar
+
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB of parsed DataFrames
+
+
+class DatasetCache:
+    """
+    Process-wide LRU cache of parsed datasets.
+
+    Entries are keyed by absolute file path (plus the selected columns, if any) and stamped
+    with the backing file's mtime and size, so a file that changes on disk is re-parsed on
+    the next access. Eviction is based on the in-memory size of the cached DataFrames.
+    Cached frames are shared between requests and must not be modified in place; copy
+    them first.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(max_bytes=int(os.environ.get("DATASET_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+    @staticmethod
+    def _key(file_path, columns=None):
+        return os.path.abspath(file_path), tuple(columns) if columns is not None else None
+
+    @staticmethod
+    def _stamp(file_path):
+        stat = os.stat(columnar.backing_path(file_path))
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _frame_bytes(data):
+        return int(data.memory_usage(deep=True).sum())
+
+    def get(self, file_path, columns=None, loader=columnar.read_columns):
+        """
+        Return the parsed dataset at file_path, parsing it only when needed.
+
+        With columns given only those columns are loaded (and cached separately), unless
+        the complete dataset is already cached.
+        """
+        key = self._key(file_path, columns)
+        full_key = self._key(file_path)
+        stamp = self._stamp(file_path)
+
+        with self._lock:
+            for candidate in (key, full_key):
+                entry = self._entries.get(candidate)
+                if entry is not None and entry[0] == stamp:
+                    self._entries.move_to_end(candidate)
+                    self.hits += 1
+                    return entry[1] if candidate == key else entry[1][list(columns)]
+            self.misses += 1
+
+        # Parse outside the lock so that other datasets stay available meanwhile
+        data = loader(file_path, columns)
+        self.put(file_path, data, columns=columns, stamp=stamp)
+        return data
+
+    def put(self, file_path, data, columns=None, stamp=None):
+        key = self._key(file_path, columns)
+        stamp = stamp if stamp is not None else self._stamp(file_path)
+        nbytes = self._frame_bytes(data)
+
+        with self._lock:
+            self._remove_locked(key)
+            if nbytes > self.max_bytes:
+                logging.info(f"Dataset {file_path} ({nbytes} bytes) exceeds the cache size; not cached")
+                return
+            self._entries[key] = (stamp, data, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def invalidate(self, file_path):
+        """Drop the cached entries for file_path, e.g. after it was renamed or deleted."""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._remove_locked(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Shared by every request handled by this process
+dataset_cache = DatasetCache.from_env()
@@ -0,0 +1,203 @@
+# dp_statistics.py
+#
+# Noisy summary statistics for the /get_noisy endpoints. Named to avoid shadowing the
+# standard library's statistics module.
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import aggregate_index
+import columnar
+from dataset_cache import dataset_cache
+from streaming_aggregates import summarize_columns
+
+OPERATIONS = ('mean', 'median', 'mode', 'min', 'max', 'variance')
+# Operations whose sensitivity scales with the value range over the number of records
+RANGE_SENSITIVE_OPERATIONS = ('mean', 'median')
+# Operations whose sensitivity scales with the squared value range over the number of records
+SQUARED_RANGE_SENSITIVE_OPERATIONS = ('variance',)
+
+# Datasets at least this large are scanned in chunks instead of being loaded whole
+DEFAULT_STREAMING_THRESHOLD_BYTES = 256 << 20
+
+
+def streaming_threshold():
+    return int(os.environ.get("STREAMING_STATS_THRESHOLD_BYTES", DEFAULT_STREAMING_THRESHOLD_BYTES))
+
+
+def calculate_sensitivity(data, column):
+    """Calculate the global sensitivity for the mean."""
+    max_value = data[column].max()
+    min_value = data[column].min()
+    num_records = len(data)
+    return (max_value - min_value) / num_records
+
+
+def determine_epsilon(total_queries, privacy_budget, base_epsilon=0.1, risk_tolerance=0.5):
+    """Dynamically determine epsilon based on operational parameters."""
+    epsilon_decay = base_epsilon / total_queries  # Adjust epsilon based on the total number of queries
+    epsilon_budget_adjusted = privacy_budget * risk_tolerance  # Adjust epsilon based on the remaining privacy budget and risk tolerance
+    return min(epsilon_decay, epsilon_budget_adjusted)  # Choose the smaller epsilon for stronger privacy
+
+
+def determine_batch_epsilons(num_queries, total_queries, privacy_budget, base_epsilon=0.1, risk_tolerance=0.5):
+    """
+    Split one budget for a batch of queries on a dataset evenly across the queries.
+
+    The batch gets what num_queries separate queries would get from determine_epsilon,
+    but the risk tolerance caps the batch as a whole rather than each query.
+
+    Returns:
+    list: The epsilon of each query.
+    """
+    batch_epsilon = min(num_queries * base_epsilon / total_queries, privacy_budget * risk_tolerance)
+    return [batch_epsilon / num_queries] * num_queries
+
+
+def calculate_noisy_statistic(data, column, epsilon, operation):
+    """Apply differential privacy noise based on the operation."""
+    check_operation(operation)
+    return noisy_value(exact_aggregates(data[column].to_numpy(), [operation]), epsilon, operation)
+
+
+def check_operation(operation):
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unsupported operation: {operation}")
+
+
+def exact_aggregates(values, operations):
+    """
+    Compute several exact aggregates of one column together.
+
+    Parameters:
+    values (np.ndarray): The column; missing values are ignored, as pandas does.
+    operations (iterable): Operations from OPERATIONS.
+
+    Returns:
+    dict: Operation -> value, plus 'count', 'min' and 'max', which the sensitivities need.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        raise ValueError("Column has no numeric values")
+
+    aggregates = {'count': len(values), 'min': float(values.min()), 'max': float(values.max())}
+    operations = set(operations)
+    if 'mean' in operations:
+        aggregates['mean'] = float(values.mean())
+    if 'median' in operations:
+        aggregates['median'] = float(np.median(values))
+    if 'mode' in operations:
+        # Smallest of the most frequent values, like Series.mode()[0]
+        unique, counts = np.unique(values, return_counts=True)
+        aggregates['mode'] = float(unique[np.argmax(counts)])
+    if 'variance' in operations:
+        # Sample variance (ddof=1), like Series.var()
+        aggregates['variance'] = float(values.var(ddof=1)) if len(values) > 1 else float('nan')
+    return aggregates
+
+
+def column_aggregates(file_path, columns):
+    """
+    Aggregates of several columns of one dataset, reading the dataset once.
+
+    A fresh aggregate index answers without reading the dataset. Otherwise small datasets
+    are loaded (through the dataset cache) and aggregated exactly while the index is built
+    in the background. Datasets over the streaming threshold get their index built in the
+    foreground, in one scan, or are scanned chunk by chunk in constant memory if that is
+    not possible. A failed build is not retried until the dataset changes. The index and the
+    streaming scan estimate medians, and modes of columns with very many distinct values,
+    with sketches (see streaming_aggregates.py).
+
+    Parameters:
+    file_path (str): The dataset.
+    columns (dict): Column name -> operations needed from it.
+
+    Returns:
+    dict: Column name -> aggregates, as returned by exact_aggregates.
+    """
+    size = os.path.getsize(columnar.backing_path(file_path))
+    index = aggregate_index.load_index(file_path)
+    if index is None and aggregate_index.needs_build(file_path):
+        if size >= streaming_threshold():
+            # The file has to be scanned anyway, so build the whole index in that one scan
+            index = aggregate_index.build_now(file_path)
+        else:
+            # Missing or stale; later queries will use the rebuilt index
+            aggregate_index.build_in_background(file_path)
+    summaries = aggregate_index.indexed_summaries(index, list(columns))
+    if summaries is None and size >= streaming_threshold():
+        summaries = summarize_columns(file_path, list(columns))
+    if summaries is not None:
+        return {column_name: summaries[column_name].aggregates(operations)
+                for column_name, operations in columns.items()}
+    df = dataset_cache.get(file_path, columns=list(columns))
+    return {column_name: exact_aggregates(df[column_name].to_numpy(), operations)
+            for column_name, operations in columns.items()}
+
+
+def noisy_value(aggregates, epsilon, operation):
+    """Release one aggregate with Laplace noise scaled to the operation's sensitivity."""
+    if operation in RANGE_SENSITIVE_OPERATIONS:
+        sensitivity = (aggregates['max'] - aggregates['min']) / aggregates['count']
+    elif operation in SQUARED_RANGE_SENSITIVE_OPERATIONS:
+        sensitivity = (aggregates['max'] - aggregates['min']) ** 2 / aggregates['count']
+    else:
+        sensitivity = 1
+    return aggregates[operation] + np.random.laplace(0, sensitivity / epsilon)
+
+
+def noisy_column_statistic(file_path, column, epsilon, operation):
+    """Noisy statistic of one column, streaming the dataset if it is large."""
+    check_operation(operation)
+    return noisy_value(column_aggregates(file_path, {column: {operation}})[column], epsilon, operation)
+
+
+def answer_queries(queries, epsilons, data_dir='data'):
+    """
+    Answer a batch of noisy statistic queries.
+
+    Every file is read once with all the columns its queries need, and every column's
+    aggregates are computed together (see column_aggregates).
+
+    Parameters:
+    queries (list): Dicts with 'fileName', 'columnName' and 'operation'.
+    epsilons (list): Epsilon spent on each query.
+
+    Returns:
+    list: One result per query, in order: the query plus 'statisticValue' and 'epsilon'.
+    """
+    if not queries:
+        raise ValueError("No queries given")
+    if len(epsilons) != len(queries):
+        raise ValueError("Expected one epsilon per query")
+    for query, epsilon in zip(queries, epsilons):
+        check_operation(query.get('operation'))
+        if not epsilon > 0:
+            raise ValueError("Not enough privacy budget")
+
+    # file -> column -> operations
+    plan = OrderedDict()
+    for query in queries:
+        plan.setdefault(query['fileName'], OrderedDict()).setdefault(query['columnName'], set()).add(query['operation'])
+
+    aggregates = {}
+    for file_name, columns in plan.items():
+        if os.path.basename(file_name) != file_name:
+            raise ValueError(f"Invalid file name: {file_name}")
+        file_path = os.path.join(data_dir, file_name)
+        for column_name, column_result in column_aggregates(file_path, columns).items():
+            aggregates[(file_name, column_name)] = column_result
+
+    results = []
+    for query, epsilon in zip(queries, epsilons):
+        results.append({
+            "fileName": query['fileName'],
+            "columnName": query['columnName'],
+            "operation": query['operation'],
+            "statisticValue": noisy_value(aggregates[(query['fileName'], query['columnName'])], epsilon, query['operation']),
+            "epsilon": epsilon,
+        })
+    return results
@@ -0,0 +1,251 @@
+# image_preview.py
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from sidecar import META_DIR
+
+DEFAULT_MAX_ITEMS = 10000
+DEFAULT_MAX_DISK_BYTES = 256 << 20
+# Eviction trims the disk tier to this share of its limit, so it does not run on every write
+DISK_LOW_WATER = 0.9
+# Widest sprite sheet, in tiles, whatever the request asks for
+MAX_SPRITE_COLUMNS = 100
+
+
+def image_to_base64(image: np.ndarray) -> str:
+    """Encode an image array as a base64 PNG string."""
+    return base64.b64encode(encode_png(image)).decode()
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    pil_image = Image.fromarray(image)
+    buffered = io.BytesIO()
+    pil_image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def image_digest(image: np.ndarray) -> str:
+    """Content address of an image: identical pixels share one thumbnail."""
+    digest = hashlib.sha1()
+    digest.update(f"{image.dtype.str}{image.shape}".encode())
+    digest.update(np.ascontiguousarray(image).tobytes())
+    return digest.hexdigest()
+
+
+def make_sprite(images, columns=None):
+    """
+    Tile a batch of images into a single sprite sheet.
+
+    Parameters:
+    images (np.ndarray): Array of shape (N, H, W) or (N, H, W, C).
+    columns (int, optional): Tiles per row; defaults to a near-square grid. Clamped to
+        the number of images and to MAX_SPRITE_COLUMNS.
+
+    Returns:
+    tuple: (PNG bytes of the sprite, grid index dict). Tile i sits at row i // columns,
+    column i % columns; unused cells at the end are left black.
+    """
+    images = np.asarray(images)
+    count = len(images)
+    tile_height, tile_width = images.shape[1:3]
+    if columns is None or columns <= 0:
+        columns = max(int(np.ceil(np.sqrt(count))), 1)
+    # The canvas is allocated from columns, so it must not exceed what the tiles need
+    columns = max(min(columns, count, MAX_SPRITE_COLUMNS), 1)
+    rows = max(int(np.ceil(count / columns)), 1)
+
+    sprite = np.zeros((rows * tile_height, columns * tile_width) + images.shape[3:], dtype=images.dtype)
+    for index, image in enumerate(images):
+        row, column = divmod(index, columns)
+        sprite[row * tile_height:(row + 1) * tile_height, column * tile_width:(column + 1) * tile_width] = image
+
+    grid = {
+        "count": count,
+        "rows": rows,
+        "columns": columns,
+        "tile_height": int(tile_height),
+        "tile_width": int(tile_width),
+    }
+    return encode_png(sprite), grid
+
+
+def raw_buffer(images):
+    """
+    Raw bytes of a batch of images in C order, plus the shape and dtype needed to decode them.
+
+    Returns:
+    tuple: (bytes, shape tuple, dtype string)
+    """
+    images = np.ascontiguousarray(images)
+    return images.tobytes(), images.shape, images.dtype.name
+
+
+def preview_etag(file_path, *parts):
+    """ETag of a preview page, derived from the file's mtime/size and the page parameters."""
+    stat = os.stat(file_path)
+    key = "|".join(str(part) for part in (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size) + parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class ThumbnailCache:
+    """
+    Two-tier cache of base64 PNG thumbnails.
+
+    Thumbnails are keyed by the digest of the image contents. Recently used ones are kept
+    in memory (LRU, bounded by max_items); every encoded thumbnail is also written to
+    disk_dir so it survives restarts and is shared between worker processes. The disk
+    tier is bounded by max_disk_bytes: reads refresh a file's mtime, and the least
+    recently used files are deleted once the limit is passed. Misses are encoded in
+    parallel in a thread pool.
+    """
+
+    def __init__(self, disk_dir=None, max_items=DEFAULT_MAX_ITEMS, workers=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.disk_dir = disk_dir
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        # Bytes on disk as seen by this process; measured on the first write
+        self._disk_bytes = None
+        self.disk_evictions = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1),
+                                            thread_name_prefix="thumbnail")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            disk_dir=os.environ.get("THUMBNAIL_CACHE_DIR", os.path.join('data', META_DIR, 'thumbnails')),
+            max_items=int(os.environ.get("THUMBNAIL_CACHE_MAX_ITEMS", DEFAULT_MAX_ITEMS)),
+            max_disk_bytes=int(os.environ.get("THUMBNAIL_CACHE_MAX_DISK_BYTES", DEFAULT_MAX_DISK_BYTES)),
+        )
+
+    def _disk_path(self, digest):
+        return os.path.join(self.disk_dir, digest[:2], f"{digest}.png")
+
+    def _disk_files(self):
+        # (mtime, size, path) of every thumbnail on disk
+        files = []
+        for directory, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith('.png'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Evicted by another process
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        return files
+
+    def _account_disk_write(self, size):
+        # A lock of its own, so a directory scan does not hold up memory lookups
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(file_size for _, file_size, _ in self._disk_files())
+            else:
+                self._disk_bytes += size
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            # Other processes write to the same directory, so evict from a fresh listing
+            files = sorted(self._disk_files())
+            total = sum(file_size for _, file_size, _ in files)
+            for _, file_size, path in files:
+                if total <= self.max_disk_bytes * DISK_LOW_WATER:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= file_size
+                self.disk_evictions += 1
+            self._disk_bytes = total
+
+    def _remember(self, digest, encoded):
+        with self._lock:
+            self._entries[digest] = encoded
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, digest):
+        with self._lock:
+            encoded = self._entries.get(digest)
+            if encoded is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return encoded
+
+        if self.disk_dir:
+            path = self._disk_path(digest)
+            try:
+                with open(path, 'rb') as f:
+                    encoded = base64.b64encode(f.read()).decode()
+                os.utime(path)  # Recently used files are evicted last
+            except OSError:
+                return None
+            self._remember(digest, encoded)
+            with self._lock:
+                self.disk_hits += 1
+            return encoded
+        return None
+
+    def _encode(self, digest, image):
+        png = encode_png(image)
+        if self.disk_dir:
+            path = self._disk_path(digest)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(png)
+                os.replace(tmp_path, path)
+                self._account_disk_write(len(png))
+            except OSError as e:
+                logging.warning(f"Could not write thumbnail {path}: {e}")
+        encoded = base64.b64encode(png).decode()
+        self._remember(digest, encoded)
+        return encoded
+
+    def encode_batch(self, images):
+        """Return the base64 PNG of every image, encoding only the ones not cached yet."""
+        digests = [image_digest(image) for image in images]
+        results = [self._lookup(digest) for digest in digests]
+
+        pending = {}
+        for index, (digest, encoded) in enumerate(zip(digests, results)):
+            if encoded is None and digest not in pending:
+                pending[digest] = self._executor.submit(self._encode, digest, images[index])
+        with self._lock:
+            self.misses += len(pending)
+
+        return [encoded if encoded is not None else pending[digest].result()
+                for digest, encoded in zip(digests, results)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_evictions": self.disk_evictions,
+                "entries": len(self._entries),
+                "max_items": self.max_items,
+            }
+
+
+# Shared by every request handled by this process
+thumbnail_cache = ThumbnailCache.from_env()
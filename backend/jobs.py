@@ -0,0 +1,213 @@
+# jobs.py
+#
+# Background job subsystem for long-running work such as DP-GAN training.
+#
+# Jobs run in a bounded pool of worker processes. Workers report progress through a
+# shared queue that a listener thread in the web process drains into the job records;
+# every state change is also passed to the on_update hook (app.py forwards it over
+# Socket.IO). Cancelling a queued job removes it from the pool; a running job is
+# stopped at its next progress report. If a worker dies (e.g. killed for running out of
+# memory) its jobs fail and the pool is replaced, so later jobs still run.
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_CONCURRENCY = 1
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _run_job(job_id, func, kwargs, events, cancelled):
+    """Entry point executed inside a worker process."""
+    if job_id in cancelled:
+        raise JobCancelled(job_id)
+    events.put((job_id, RUNNING, None))
+
+    def progress_callback(current, total, **metrics):
+        if job_id in cancelled:
+            raise JobCancelled(job_id)
+        events.put((job_id, 'progress', {"current": current, "total": total, **metrics}))
+
+    return func(progress_callback=progress_callback, **kwargs)
+
+
+class JobManager:
+    def __init__(self, max_workers=DEFAULT_CONCURRENCY, on_update=None, max_finished_jobs=1000):
+        self.max_workers = max_workers
+        self.on_update = on_update
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        # The pool, the manager process and the listener are started on the first submission
+        self._context = None
+        self._executor = None
+        self._manager = None
+        self._events = None
+        self._cancelled = None
+        self._listener = None
+
+    @classmethod
+    def from_env(cls, on_update=None):
+        return cls(max_workers=int(os.environ.get("JOB_CONCURRENCY", DEFAULT_CONCURRENCY)), on_update=on_update)
+
+    def _start(self):
+        if self._executor is not None:
+            return
+        # Spawned workers do not inherit the web process's threads, sockets or framework state
+        self._context = multiprocessing.get_context('spawn')
+        self._manager = self._context.Manager()
+        self._events = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._executor = self._new_executor()
+        self._listener = threading.Thread(target=self._listen, name="job-events", daemon=True)
+        self._listener.start()
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+
+    def _replace_broken_executor_locked(self, broken):
+        # Several jobs of the broken pool may report it; only the first replaces it
+        if broken is None or self._executor is not broken:
+            return
+        logging.warning("A job worker process died; starting a new worker pool")
+        self._executor = self._new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind, func, **kwargs):
+        """
+        Schedule func(progress_callback=..., **kwargs) in a worker process.
+
+        func must be a module-level function so it can be sent to the worker.
+
+        Returns:
+        dict: The new job record.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._start()
+            self._jobs[job_id] = job
+            try:
+                future = self._executor.submit(_run_job, job_id, func, kwargs, self._events, self._cancelled)
+            except BrokenProcessPool:
+                self._replace_broken_executor_locked(self._executor)
+                future = self._executor.submit(_run_job, job_id, func, kwargs, self._events, self._cancelled)
+            executor = self._executor
+            self._futures[job_id] = future
+        future.add_done_callback(lambda done, job_id=job_id, executor=executor: self._finish(job_id, done, executor))
+        self._notify(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def cancel(self, job_id):
+        """Cancel a job. Returns the updated record, or None if the job is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] in FINISHED_STATES:
+                return dict(job)
+            future = self._futures.get(job_id)
+            # Running jobs notice the flag at their next progress report
+            self._cancelled[job_id] = True
+        if future is not None:
+            future.cancel()
+        return self.get(job_id)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                return
+            job.update(fields)
+        self._notify(job_id)
+
+    def _finish(self, job_id, future, executor=None):
+        try:
+            result = future.result()
+            fields = {"status": SUCCEEDED, "result": result}
+        except (CancelledError, JobCancelled):
+            fields = {"status": CANCELLED}
+        except BrokenProcessPool as e:
+            logging.error(f"Job {job_id} failed: its worker process died ({e})")
+            fields = {"status": FAILED, "error": "The worker process running the job died"}
+            with self._lock:
+                self._replace_broken_executor_locked(executor)
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}")
+            fields = {"status": FAILED, "error": str(e)}
+        fields["finished_at"] = time.time()
+        self._update(job_id, **fields)
+        with self._lock:
+            self._futures.pop(job_id, None)
+            self._cancelled.pop(job_id, None)
+            self._prune_locked()
+
+    def _prune_locked(self):
+        finished = [job for job in self._jobs.values() if job["status"] in FINISHED_STATES]
+        if len(finished) > self.max_finished_jobs:
+            finished.sort(key=lambda job: job["finished_at"])
+            for job in finished[:len(finished) - self.max_finished_jobs]:
+                del self._jobs[job["id"]]
+
+    def _listen(self):
+        while True:
+            try:
+                job_id, kind, payload = self._events.get()
+            except (EOFError, OSError):
+                return  # The manager process has shut down
+            except queue.Empty:
+                continue
+            if kind == RUNNING:
+                self._update(job_id, status=RUNNING, started_at=time.time())
+            else:
+                self._update(job_id, progress=payload)
+
+    def _notify(self, job_id):
+        if self.on_update is None:
+            return
+        job = self.get(job_id)
+        try:
+            self.on_update(job)
+        except Exception as e:
+            logging.warning(f"Job update hook failed for {job_id}: {e}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
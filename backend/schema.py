@@ -0,0 +1,104 @@
+# schema.py
+
+import csv
+import io
+import json
+import logging
+import os
+from itertools import islice
+
+import pandas as pd
+
+import columnar
+from sidecar import ensure_meta_dir, register_suffix, sidecar_path
+
+SCHEMA_SUFFIX = register_suffix('schema.json')
+DEFAULT_SAMPLE_ROWS = 1000
+
+
+def _source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def sniff_schema(file_path, sample_rows=DEFAULT_SAMPLE_ROWS):
+    """
+    Infer the schema of a CSV file from its header and the first sample_rows rows.
+
+    Parameters:
+    file_path (str): Path of the CSV file.
+    sample_rows (int): Number of data rows to read for dtype inference.
+
+    Returns:
+    dict: Column names and dtypes, plus an estimated row count extrapolated from the
+    average size of the sampled rows (exact when the whole file fits in the sample).
+    """
+    stamp = _source_stamp(file_path)
+
+    with open(file_path, 'rb') as f:
+        # csv.reader finds the record boundaries, so quoted fields containing newlines
+        # are not split; the raw bytes of the records it consumed are kept for pandas
+        raw_lines = []
+
+        def lines():
+            for line in f:
+                raw_lines.append(line)
+                yield line.decode('utf-8', errors='replace')
+
+        reader = csv.reader(lines())
+        next(reader, None)
+        header_bytes = len(b''.join(raw_lines))
+        records = sum(1 for _ in islice(reader, sample_rows))
+        reached_end = not f.read(1)
+
+    sample = pd.read_csv(io.BytesIO(b''.join(raw_lines)))
+    sample_bytes = len(b''.join(raw_lines)) - header_bytes
+
+    if reached_end:
+        estimated_rows = len(sample)
+    elif sample_bytes:
+        estimated_rows = int(round((stamp["size"] - header_bytes) / (sample_bytes / records)))
+    else:
+        estimated_rows = 0
+
+    return {
+        "source": stamp,
+        "columns": [{"name": str(name), "dtype": str(dtype)} for name, dtype in sample.dtypes.items()],
+        "sample_rows": len(sample),
+        "estimated_rows": estimated_rows,
+        "row_count_exact": reached_end,
+    }
+
+
+def write_schema(file_path, sample_rows=DEFAULT_SAMPLE_ROWS):
+    """Sniff the schema of file_path and store it as a sidecar record."""
+    schema = sniff_schema(file_path, sample_rows=sample_rows)
+    ensure_meta_dir(file_path)
+    path = sidecar_path(file_path, SCHEMA_SUFFIX)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(schema, f)
+    os.replace(tmp_path, path)
+    return schema
+
+
+def load_schema(file_path):
+    """Return the sidecar schema of file_path, re-sniffing it if missing or stale."""
+    if columnar.is_virtual(file_path):
+        return columnar.columnar_schema(file_path)
+
+    path = sidecar_path(file_path, SCHEMA_SUFFIX)
+    try:
+        with open(path) as f:
+            schema = json.load(f)
+        if schema.get("source") == _source_stamp(file_path):
+            return schema
+    except (OSError, ValueError):
+        pass
+
+    try:
+        return write_schema(file_path)
+    except OSError as e:
+        # A read-only data directory still gets a schema, just not a cached one
+        logging.warning(f"Could not store schema sidecar for {file_path}: {e}")
+        return sniff_schema(file_path)
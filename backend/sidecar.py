@@ -0,0 +1,50 @@
+# sidecar.py
+
+import os
+
+# Derived files (schemas, caches, indexes) live in a hidden directory next to each dataset
+META_DIR = '.meta'
+
+# Suffixes of the per-dataset sidecars, registered by the modules that write them
+_suffixes = set()
+
+
+def register_suffix(suffix):
+    _suffixes.add(suffix)
+    return suffix
+
+
+def sidecar_path(file_path, suffix):
+    """
+    Path of the sidecar file holding derived data for a dataset.
+
+    Parameters:
+    file_path (str): Path of the dataset, e.g. 'data/ratings.csv'.
+    suffix (str): Kind of sidecar, e.g. 'schema.json'.
+
+    Returns:
+    str: e.g. 'data/.meta/ratings.csv.schema.json'.
+    """
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, META_DIR, f"{name}.{suffix}")
+
+
+def ensure_meta_dir(file_path):
+    os.makedirs(os.path.join(os.path.dirname(file_path), META_DIR), exist_ok=True)
+
+
+def remove_sidecars(file_path):
+    """Delete every sidecar belonging to file_path."""
+    for suffix in _suffixes:
+        path = sidecar_path(file_path, suffix)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def rename_sidecars(old_file_path, new_file_path):
+    """Move the sidecars of a renamed dataset so they follow the new name."""
+    for suffix in _suffixes:
+        path = sidecar_path(old_file_path, suffix)
+        if os.path.isfile(path):
+            ensure_meta_dir(new_file_path)
+            os.replace(path, sidecar_path(new_file_path, suffix))
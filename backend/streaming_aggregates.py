@@ -0,0 +1,245 @@
+# streaming_aggregates.py
+#
+# One-pass, constant-memory column summaries for datasets too large to load at once.
+# Count, mean, variance, min and max are exact; the median comes from a KLL
+# quantile sketch and the mode from Misra-Gries heavy-hitter counters. Every summary
+# is mergeable, so chunks can be summarized independently and combined, and can be
+# stored as JSON (see aggregate_index.py).
+
+import math
+
+import numpy as np
+
+import columnar
+
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty, 2016).
+
+    Items are kept in levels of compactors; an item at level h stands for 2**h inputs.
+    A full level is sorted and every other item (from a random offset) moves up, so the
+    sketch keeps O(k log(n/k)) items with a rank error of roughly 1.7 / k. Until the
+    first compaction it holds every input and its quantiles are exact.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        self._compress()
+
+    def merge(self, other):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) > sum(self._capacity(h) for h in range(len(self.levels))):
+            level = next(h for h in range(len(self.levels)) if len(self.levels[h]) >= self._capacity(h))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind so the weights keep adding up
+            kept, items = (items[-1:], items[:-1]) if len(items) % 2 else (items[:0], items)
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self._rng.integers(2)::2]])
+            self.levels[level] = kept
+
+    @property
+    def count(self):
+        return sum(len(items) << level for level, items in enumerate(self.levels))
+
+    def quantile(self, q):
+        if self.count == 0:
+            raise ValueError("Sketch is empty")
+        if len(self.levels) == 1:
+            return float(np.quantile(self.levels[0], q))
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 1 << level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        index = int(np.searchsorted(cumulative, q * cumulative[-1]))
+        return float(items[order][min(index, len(items) - 1)])
+
+    def to_dict(self):
+        return {"k": self.k, "levels": [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, record):
+        sketch = cls(record["k"])
+        sketch.levels = [np.array(items, dtype=np.float64) for items in record["levels"]]
+        return sketch
+
+
+class HeavyHitters:
+    """
+    Misra-Gries frequent-item counters.
+
+    Keeps at most `capacity` values; any value occurring more than n / (capacity + 1)
+    times is guaranteed to be kept. While a column has no more distinct values than
+    counters, the counts are exact: they form the column's histogram.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.values = np.empty(0)
+        self.counts = np.empty(0, dtype=np.int64)
+        # False once a counter has been decremented
+        self.exact = True
+
+    def update(self, values):
+        values, counts = np.unique(np.asarray(values, dtype=np.float64), return_counts=True)
+        self._add(values, counts)
+
+    def merge(self, other):
+        self._add(other.values, other.counts)
+        self.exact = self.exact and other.exact
+
+    def _add(self, values, counts):
+        values, inverse = np.unique(np.concatenate([self.values, values]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts])).astype(np.int64)
+        if len(values) > self.capacity:
+            # Subtract the (capacity + 1)-th largest count from every counter
+            threshold = np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1]
+            counts = counts - threshold
+            values, counts = values[counts > 0], counts[counts > 0]
+            self.exact = False
+        self.values, self.counts = values, counts
+
+    def mode(self):
+        if len(self.values) == 0:
+            raise ValueError("No values counted")
+        # Values are sorted, so ties resolve to the smallest, like Series.mode()[0]
+        return float(self.values[np.argmax(self.counts)])
+
+    def median(self):
+        """Exact median from the counts; only meaningful while exact is True."""
+        cumulative = np.cumsum(self.counts)
+        total = int(cumulative[-1])
+        # Middle value, or the mean of the two middle values, like np.median
+        lower = self.values[np.searchsorted(cumulative, (total - 1) // 2, side='right')]
+        upper = self.values[np.searchsorted(cumulative, total // 2, side='right')]
+        return float((lower + upper) / 2)
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "values": self.values.tolist(), "counts": self.counts.tolist(),
+                "exact": self.exact}
+
+    @classmethod
+    def from_dict(cls, record):
+        frequent = cls(record["capacity"])
+        frequent.values = np.array(record["values"], dtype=np.float64)
+        frequent.counts = np.array(record["counts"], dtype=np.int64)
+        frequent.exact = record["exact"]
+        return frequent
+
+
+class ColumnSummary:
+    """Mergeable one-pass summary of a numeric column; missing values are ignored."""
+
+    def __init__(self, sketch_k=200, heavy_hitters=1024):
+        self.count = 0
+        # Mean and sum of squared deviations from it; unlike a raw sum of squares, these
+        # keep the variance accurate when the values are large compared to their spread
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = KLLSketch(sketch_k)
+        self.frequent = HeavyHitters(heavy_hitters)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        mean = float(values.mean())
+        deviations = values - mean
+        self._combine(len(values), mean, float(np.dot(deviations, deviations)))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.quantiles.update(values)
+        self.frequent.update(values)
+
+    def _combine(self, count, mean, m2):
+        # Parallel variance formula of Chan, Golub and LeVeque
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.quantiles.merge(other.quantiles)
+        self.frequent.merge(other.frequent)
+
+    def aggregates(self, operations):
+        """Same result shape as dp_statistics.exact_aggregates."""
+        if self.count == 0:
+            raise ValueError("Column has no numeric values")
+        aggregates = {'count': self.count, 'min': self.min, 'max': self.max}
+        operations = set(operations)
+        if 'mean' in operations:
+            aggregates['mean'] = self.mean
+        if 'median' in operations:
+            # Columns with few distinct values get their exact median from the counts
+            aggregates['median'] = self.frequent.median() if self.frequent.exact else self.quantiles.quantile(0.5)
+        if 'mode' in operations:
+            aggregates['mode'] = self.frequent.mode()
+        if 'variance' in operations:
+            # Sample variance (ddof=1), like Series.var()
+            aggregates['variance'] = self.m2 / (self.count - 1) if self.count > 1 else float('nan')
+        return aggregates
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "histogram": self.frequent.to_dict(),
+            "sketch": self.quantiles.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, record):
+        summary = cls()
+        summary.count = record["count"]
+        summary.mean = record["mean"]
+        summary.m2 = record["m2"]
+        summary.min = record["min"]
+        summary.max = record["max"]
+        summary.frequent = HeavyHitters.from_dict(record["histogram"])
+        summary.quantiles = KLLSketch.from_dict(record["sketch"])
+        return summary
+
+
+def summarize_columns(file_path, column_names, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Summarize columns of a dataset chunk by chunk, holding one chunk in memory at a time.
+
+    Returns:
+    dict: Column name -> ColumnSummary.
+    """
+    summaries = {column_name: ColumnSummary() for column_name in column_names}
+    for chunk in columnar.iter_chunks(file_path, column_names, chunk_rows):
+        for column_name, summary in summaries.items():
+            summary.update(chunk[column_name].to_numpy())
+    return summaries
@@ -0,0 +1,400 @@
+# tasks.py
+#
+# Data generation work that can run either inside a request or in a job worker process
+# (see jobs.py). Nothing in here depends on Flask.
+
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import columnar
+from algorithm_registry import AlgorithmRegistry, register_default_algorithms
+from dataset_cache import dataset_cache
+
+# Worker processes import this module without app.py, so they register the algorithms here
+register_default_algorithms()
+
+DATA_DIR = 'data'
+# The UI sends +-Number.MAX_SAFE_INTEGER for clipping bounds left empty
+UNBOUNDED_CLIP = 2 ** 53 - 1
+# Algorithms that scale their output domain or loss terms by the clipping range, so they
+# need finite bounds; the Laplace and Gaussian mechanisms only clip, with sensitivity 1
+BOUNDED_CLIP_ALGORITHMS = {"DP-GAN", "Opacus Synthesizer"}
+# Algorithms that accept a public list of categories as their output domain, in place
+# of one derived from the clipping bounds
+CATEGORICAL_ALGORITHMS = {"Opacus Synthesizer"}
+# Algorithms that store trained generators (see algorithms/generator_store.py); they are
+# told the dataset, so its generators can be removed when it is deleted
+STORED_GENERATOR_ALGORITHMS = {"DP-GAN"}
+
+
+class InvalidRequestError(ValueError):
+    pass
+
+
+def check_clip_bounds(lower_clip, upper_clip, bounded=False):
+    """
+    Require ordered clipping bounds, and finite ones if bounded is True.
+
+    Algorithms in BOUNDED_CLIP_ALGORITHMS scale their output by the clipping range, so
+    unbounded ranges would make their output meaningless.
+    """
+    try:
+        lower, upper = float(lower_clip), float(upper_clip)
+    except (TypeError, ValueError):
+        raise InvalidRequestError("lowerClip and upperClip must be numbers")
+    if bounded and not all(math.isfinite(bound) and abs(bound) < UNBOUNDED_CLIP for bound in (lower, upper)):
+        raise InvalidRequestError("lowerClip and upperClip must both be set to finite values")
+    if lower > upper:
+        raise InvalidRequestError("lowerClip must not be greater than upperClip")
+
+
+def check_categories(algorithm_name, categories):
+    """Require a non-empty list of all strings or all numbers, for an algorithm that takes one."""
+    if algorithm_name not in CATEGORICAL_ALGORITHMS:
+        raise InvalidRequestError(f"Algorithm {algorithm_name} does not take categories")
+    if not isinstance(categories, list) or not categories:
+        raise InvalidRequestError("categories must be a non-empty list")
+    if not (all(isinstance(category, str) for category in categories) or
+            all(isinstance(category, (int, float)) and not isinstance(category, bool) for category in categories)):
+        raise InvalidRequestError("categories must be all strings or all numbers")
+
+
+def check_tabular_request(algorithm_name, filename, column_name, lower_clip=0, upper_clip=5, categories=None):
+    """Validate a synthetic-data request before any work is scheduled."""
+    if not column_name:
+        raise InvalidRequestError("Column name not provided")
+    if categories is not None:
+        check_categories(algorithm_name, categories)
+    # A listed category domain takes the place of the clipping range
+    bounded = algorithm_name in BOUNDED_CLIP_ALGORITHMS and categories is None
+    check_clip_bounds(lower_clip, upper_clip, bounded=bounded)
+
+    uploaded_file_path = os.path.join(DATA_DIR, filename)
+    if not columnar.dataset_exists(uploaded_file_path):
+        logging.error(f"File does not exist: {filename}")
+        raise InvalidRequestError("File does not exist")
+
+    if algorithm_name not in AlgorithmRegistry.registered_names():
+        logging.error(f"Algorithm not found in registry: {algorithm_name}")
+        raise InvalidRequestError(f"Algorithm {algorithm_name} not registered")
+
+    # Make sure the column exists in the data
+    if column_name not in columnar.column_names(uploaded_file_path):
+        raise InvalidRequestError(f"Column {column_name} not found in data")
+    return uploaded_file_path
+
+
+def algorithm_options(algorithm_name, filename, categories=None):
+    """Keyword arguments of generate_synthetic_data that only some algorithms take."""
+    options = {}
+    if categories is not None:
+        options["categories"] = categories
+    if algorithm_name in STORED_GENERATOR_ALGORITHMS:
+        options["dataset"] = filename
+    return options
+
+
+def generate_tabular_data(algorithm_name, filename, column_name, epsilon=1.0, delta=1e-5,
+                          lower_clip=0, upper_clip=5, categories=None, progress_callback=None):
+    """
+    Replace one column of a dataset with synthetic values and store the result.
+
+    categories, if given, is the public list of values the column may take, for
+    algorithms in CATEGORICAL_ALGORITHMS.
+
+    Returns:
+    dict: 'file_path' and 'file_name' of the generated dataset.
+    """
+    uploaded_file_path = check_tabular_request(algorithm_name, filename, column_name, lower_clip, upper_clip,
+                                               categories)
+    logging.info(f"File found: {filename}")
+
+    dp_algorithm = AlgorithmRegistry.get_algorithm(algorithm_name)
+    logging.info(f"Algorithm retrieved: {algorithm_name}")
+
+    # Only the privatized column is loaded; the other columns are copied over on write
+    original_data = dataset_cache.get(uploaded_file_path, columns=[column_name])
+    sample_size = len(original_data)
+
+    logging.info("Generating synthetic data...")
+    synthetic_data = dp_algorithm.generate_synthetic_data(
+        original_data[column_name].values,
+        sample_size,
+        epsilon,
+        delta,
+        lower_clip,
+        upper_clip,
+        progress_callback=progress_callback,
+        **algorithm_options(algorithm_name, filename, categories)
+    )
+    logging.info("Synthetic data generation complete.")
+
+    # Sanitize epsilon and delta by replacing dots with underscores
+    epsilon_str = str(epsilon).replace('.', '_')
+    delta_str = str(delta).replace('.', '_')
+
+    # Update the filename to include the algorithm name and clipping values
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    modified_file_name = f"{algorithm_name}_eps{epsilon_str}_delta{delta_str}_lower{lower_clip}_upper{upper_clip}_data_{timestamp}.csv"
+    modified_file_path = os.path.join(DATA_DIR, modified_file_name)
+
+    columnar.write_with_column(uploaded_file_path, modified_file_path, column_name, synthetic_data)
+    logging.info(f"Modified data written to {modified_file_path}")
+
+    return {
+        "file_path": modified_file_path,
+        "file_name": modified_file_name
+    }
+
+
+def _positive_number(value, name):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidRequestError(f"{name} must be a number")
+    if not (math.isfinite(number) and number > 0):
+        raise InvalidRequestError(f"{name} must be a positive number")
+    return number
+
+
+def check_multi_column_request(default_algorithm, filename, columns, epsilon, delta):
+    """
+    Validate a multi-column request and work out each column's settings.
+
+    Parameters:
+    default_algorithm (str): Algorithm for columns that do not name one.
+    filename (str): Dataset in DATA_DIR.
+    columns (list): One dict per column: 'column_name' and optionally 'algorithm',
+        'epsilon', 'lowerClip', 'upperClip' and 'categories'.
+    epsilon, delta (float): Total budget of the request. Columns without their own
+        epsilon share what the others leave; delta is split evenly.
+
+    Returns:
+    list: One dict per column with algorithm_name, column_name, epsilon, delta,
+    lower_clip, upper_clip and categories.
+    """
+    if not isinstance(columns, list) or not columns:
+        raise InvalidRequestError("columns must be a non-empty list")
+    if not all(isinstance(spec, dict) for spec in columns):
+        raise InvalidRequestError("Every entry of columns must be an object")
+    names = [spec.get('column_name') for spec in columns]
+    if not all(isinstance(name, str) and name for name in names):
+        raise InvalidRequestError("Every entry of columns needs a column_name")
+    if len(set(names)) != len(names):
+        raise InvalidRequestError("Each column may only be listed once")
+    epsilon = _positive_number(epsilon, "epsilon")
+    delta = _positive_number(delta, "delta")
+
+    # Every column is computed from the same records, so the budgets add up
+    explicit = [_positive_number(spec['epsilon'], f"epsilon of column {spec['column_name']}")
+                for spec in columns if spec.get('epsilon') is not None]
+    shared = len(columns) - len(explicit)
+    remaining = epsilon - sum(explicit)
+    if (shared and remaining <= 0) or remaining < 0:
+        raise InvalidRequestError("Per-column epsilons exceed the request's epsilon")
+
+    plans = []
+    for spec in columns:
+        algorithm_name = spec.get('algorithm') or default_algorithm
+        if not isinstance(algorithm_name, str):
+            raise InvalidRequestError("algorithm must be a string")
+        check_tabular_request(algorithm_name, filename, spec.get('column_name'),
+                              spec.get('lowerClip', 0), spec.get('upperClip', 5), spec.get('categories'))
+        plans.append({
+            "algorithm_name": algorithm_name,
+            "column_name": spec['column_name'],
+            "epsilon": float(spec['epsilon']) if spec.get('epsilon') is not None else remaining / shared,
+            "delta": delta / len(columns),
+            "lower_clip": float(spec.get('lowerClip', 0)),
+            "upper_clip": float(spec.get('upperClip', 5)),
+            "categories": spec.get('categories'),
+        })
+    return plans
+
+
+def synthesize_column(algorithm_name, values, epsilon, delta, lower_clip, upper_clip, options=None):
+    """Run one algorithm on one column; executed in a column worker process."""
+    dp_algorithm = AlgorithmRegistry.get_algorithm(algorithm_name)
+    return dp_algorithm.generate_synthetic_data(values, len(values), epsilon, delta, lower_clip, upper_clip,
+                                                **(options or {}))
+
+
+def column_workers(num_columns):
+    workers = int(os.environ.get("COLUMN_WORKERS", os.cpu_count() or 1))
+    # Daemonic processes (e.g. multiprocessing pool workers) may not start children
+    if multiprocessing.current_process().daemon:
+        workers = 1
+    return max(1, min(workers, num_columns))
+
+
+def generate_multi_column_data(algorithm_name, filename, columns, epsilon=1.0, delta=1e-5, progress_callback=None):
+    """
+    Replace several columns of a dataset with synthetic values and store one result.
+
+    The dataset is read once. Columns are synthesized in parallel worker processes, each
+    with its own algorithm, clipping bounds and share of the budget.
+
+    Returns:
+    dict: 'file_path', 'file_name' and 'columns' (the settings used for every column).
+    """
+    plans = check_multi_column_request(algorithm_name, filename, columns, epsilon, delta)
+    uploaded_file_path = os.path.join(DATA_DIR, filename)
+
+    # Only the privatized columns are loaded; the other columns are copied over on write
+    original_data = dataset_cache.get(uploaded_file_path, columns=[plan['column_name'] for plan in plans])
+
+    synthetic_columns = {}
+    workers = column_workers(len(plans))
+    logging.info(f"Generating {len(plans)} synthetic columns with {workers} workers...")
+    if workers == 1:
+        for plan in plans:
+            synthetic_columns[plan['column_name']] = synthesize_column(
+                plan['algorithm_name'], original_data[plan['column_name']].values, plan['epsilon'], plan['delta'],
+                plan['lower_clip'], plan['upper_clip'],
+                algorithm_options(plan['algorithm_name'], filename, plan['categories']))
+            if progress_callback is not None:
+                progress_callback(len(synthetic_columns), len(plans), column=plan['column_name'])
+    else:
+        # Spawned workers start clean instead of inheriting the web server's state
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futures = {
+                executor.submit(synthesize_column, plan['algorithm_name'], original_data[plan['column_name']].values,
+                                plan['epsilon'], plan['delta'], plan['lower_clip'], plan['upper_clip'],
+                                algorithm_options(plan['algorithm_name'], filename, plan['categories'])):
+                    plan['column_name']
+                for plan in plans
+            }
+            for future in as_completed(futures):
+                synthetic_columns[futures[future]] = future.result()
+                if progress_callback is not None:
+                    progress_callback(len(synthetic_columns), len(plans), column=futures[future])
+        finally:
+            # Drops the remaining columns if one failed or the job was cancelled
+            executor.shutdown(wait=True, cancel_futures=True)
+    logging.info("Synthetic data generation complete.")
+
+    # Sanitize epsilon and delta by replacing dots with underscores
+    epsilon_str = str(epsilon).replace('.', '_')
+    delta_str = str(delta).replace('.', '_')
+
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    modified_file_name = f"multi_{len(plans)}cols_eps{epsilon_str}_delta{delta_str}_data_{timestamp}.csv"
+    modified_file_path = os.path.join(DATA_DIR, modified_file_name)
+
+    columnar.write_with_columns(uploaded_file_path, modified_file_path, synthetic_columns)
+    logging.info(f"Modified data written to {modified_file_path}")
+
+    return {
+        "file_path": modified_file_path,
+        "file_name": modified_file_name,
+        "columns": plans
+    }
+
+
+def generate_image_data(algorithm_name, train_images_file, train_labels_file, epsilon=1.0, delta=1e-5,
+                        lower_clip=0, upper_clip=5, sample_size=100, classes=None, progress_callback=None):
+    """
+    Train an image generator on the given .npy files and save synthetic train images and labels.
+
+    classes, if given, is the public list of label classes; otherwise the algorithm's
+    default label domain is used.
+
+    Returns:
+    dict: 'train_images_dir' and 'train_labels_file' of the saved synthetic data.
+    """
+    dp_algorithm = AlgorithmRegistry.get_algorithm(algorithm_name)
+    logging.info(f"Algorithm retrieved: {algorithm_name}")
+
+    # Load only train images and labels
+    train_images = load_images(train_images_file)
+    train_labels = load_labels(train_labels_file)
+
+    # Generate synthetic data
+    label_options = {"classes": classes} if classes is not None else {}
+    synthetic_train_images, synthetic_train_labels = dp_algorithm.generate_synthetic_data(
+        train_images, train_labels, sample_size, epsilon, delta, lower_clip, upper_clip,
+        progress_callback=progress_callback, **label_options
+    )
+
+    # Save only train images and labels
+    return save_synthetic_data(synthetic_train_images, synthetic_train_labels)
+
+
+def save_synthetic_data(synthetic_train_images, synthetic_train_labels):
+    # Define the directories for saving the data
+    train_images_dir = os.path.join(DATA_DIR, 'train_images')
+    train_labels_dir = os.path.join(DATA_DIR, 'train_labels.csv')
+
+    # Create the directories if they don't exist
+    os.makedirs(train_images_dir, exist_ok=True)
+
+    # Save train images and labels
+    train_labels_list = []
+    for index, (image, label) in enumerate(zip(synthetic_train_images, synthetic_train_labels)):
+        try:
+            # Reshape image if it's grayscale
+            if image.shape[-1] == 1:
+                image = image.reshape(image.shape[0], image.shape[1])
+
+            # Convert to PIL image and save
+            img = Image.fromarray(image.astype(np.uint8))
+            img.save(os.path.join(train_images_dir, f'train_image_{index}.png'))
+            train_labels_list.append({'id': index, 'label': label})
+        except Exception as e:
+            print(f"Error saving image {index}: {e}")
+
+    # Save train labels to CSV
+    pd.DataFrame(train_labels_list).to_csv(train_labels_dir, index=False)
+
+    # Return only the paths for train images and labels
+    return {
+        'train_images_dir': train_images_dir,
+        'train_labels_file': train_labels_dir
+    }
+
+
+def load_images(file_path):
+    """
+    Load images from a .npy file as a read-only memory map.
+
+    Parameters:
+    file_path (str): The path to the .npy file containing the images.
+
+    Returns:
+    np.memmap: The images; pages are read from disk only when accessed.
+    """
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+    # Map the images instead of reading the whole file up front
+    images = np.load(file_path, mmap_mode='r')
+
+    return images
+
+
+def load_labels(file_path):
+    """
+    Load labels from a .npy file as a read-only memory map.
+
+    Parameters:
+    file_path (str): Path to the .npy file containing labels.
+
+    Returns:
+    numpy.memmap: Array of labels.
+    """
+    try:
+        labels = np.load(file_path, mmap_mode='r')
+        return labels
+    except Exception as e:
+        logging.error(f"Failed to load labels from {file_path}: {e}")
+        raise
@@ -28,7 +28,7 @@ const AlgorithmSelectorRemix: React.FC<AlgorithmSelectorProps> = ({
   const [fileList, setFileList] = useState<string[]>([]);
   const [columnNames, setColumnNames] = useState<string[]>([]);
   const [selectedColumnName, setSelectedColumnName] = useState<string>('');
-  const algorithms = ['Gaussian Mechanism', 'Laplace Mechanism', 'DP-GAN'];
+  const algorithms = ['Gaussian Mechanism', 'Laplace Mechanism', 'DP-GAN', 'Opacus Synthesizer'];
 
   useEffect(() => {
     const fetchFileList = async () => {
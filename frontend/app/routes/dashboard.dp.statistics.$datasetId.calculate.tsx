@@ -125,7 +125,7 @@ export default function StatisticsPage() {
     const { dataset, columnNames, result, message } = useLoaderData<typeof loader>();
     const [calculationResult, setCalculationResult] = useState(null);
     const [selectedColumn, setSelectedColumn] = useState('');
-    const operations = ["mean", "median", "mode", "min", "max"];
+    const operations = ["mean", "median", "mode", "min", "max", "variance"];
     const [selectedOperation, setSelectedOperation] = useState(operations[0]);
 
     // Function to handle the selection of an operation
@@ -164,6 +164,7 @@ export default function StatisticsPage() {
                         <option value="mode">Mode</option>
                         <option value="min">Min</option>
                         <option value="max">Max</option>
+                        <option value="variance">Variance</option>
                     </select>
                 </div>
 
@@ -9,7 +9,7 @@ import AlgorithmSelectorRemix from "./AlgorithmSelectorTabular";
 import invariant from "tiny-invariant";
 import { updateDataset } from "~/models/dataset.server";
 
-const operations = ["mean", "median", "mode", "min", "max"];
+const operations = ["mean", "median", "mode", "min", "max", "variance"];
 
 type Dataset = {
   id: string;